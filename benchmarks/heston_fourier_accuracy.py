@@ -0,0 +1,59 @@
+"""
+Accuracy of the FFT and COS Heston pricers against the adaptive quad price, on the demo parameter sets and on
+sets where E[S_T^(alpha + 1)] explodes for the usual FFT damping alpha = 1.5: long maturities, positive rho and
+a high vol of vol.
+
+Run from the repository root, the exit code is 1 if any price is further than TOLERANCE from quad:
+    python -m benchmarks.heston_fourier_accuracy
+"""
+import sys
+
+from numpy import array
+
+from src.options.heston_model.heston_model import HestonModel
+
+# (name, s, k, t, v, r, theta, kappa, sigma, rho)
+PARAMETER_SETS = [
+    ('hest11', 150, 155, 15/365, 0.0105, 0.1, 0.0837, 74.32, 3.4532, -0.8912),
+    ('hest_2', 1, 2, 10, 0.16, 0, 0.16, 1, 2, -0.8),
+    ('positive_rho_5y', 100, 100, 5, 0.09, 0, 0.09, 0.3, 1, 0.5),
+    ('positive_rho_3y', 100, 100, 3, 0.09, 0, 0.09, 1.5, 0.8, 0.3),
+    ('positive_rho_10y', 100, 100, 10, 0.09, 0, 0.09, 1.5, 0.8, 0.3),
+    ('positive_rho_otm', 100, 120, 2, 0.04, 0.02, 0.06, 0.5, 0.9, 0.6),
+    ('equity_1y', 100, 90, 1, 0.04, 0.02, 0.04, 2, 0.5, -0.7),
+    # Andersen (2008) case II.
+    ('andersen_ii', 100, 100, 5, 0.04, 0.0, 0.04, 0.3, 0.9, -0.5),
+]
+# Strikes as a fraction of the strike of each set.
+MONEYNESS = array([0.8, 0.9, 1.0, 1.1, 1.2])
+# Absolute price error relative to the strike.
+TOLERANCE = 1e-6
+
+
+def accuracy(name, s, k, t, v, r, theta, kappa, sigma, rho):
+    """
+    :return: largest FFT and COS errors over the strikes, relative to the strike.
+    """
+    strikes = MONEYNESS * k
+    model = HestonModel(s, k, t, v, r, theta, kappa, sigma, rho)
+    quad_prices = array([HestonModel(s, strike, t, v, r, theta, kappa, sigma, rho).european_call()
+                         for strike in strikes])
+    fft_error = (abs(model.european_call_fft(strikes) - quad_prices) / strikes).max()
+    cos_error = (abs(model.european_call_cos(strikes) - quad_prices) / strikes).max()
+    (alpha, n_points, eta) = model.fft_grid()
+    print("{:<18} {:>8.3f} {:>8} {:>8.4f} {:>12.3g} {:>12.3g}".format(name, alpha, n_points, eta, fft_error,
+                                                                      cos_error))
+    return fft_error, cos_error
+
+
+def main():
+    print("{:<18} {:>8} {:>8} {:>8} {:>12} {:>12}".format('parameters', 'alpha', 'points', 'eta', 'fft error',
+                                                          'cos error'))
+    failures = 0
+    for parameter_set in PARAMETER_SETS:
+        failures += max(accuracy(*parameter_set)) > TOLERANCE
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,51 @@
+"""
+Convergence of the HestonProcess discretisation schemes against the semi-analytic HestonModel.european_call.
+
+For each scheme and number of time steps the Monte Carlo price is computed with a fixed seed and compared with
+the Fourier price. The bias that is left once the standard error is small shows how many time steps every
+scheme needs for a given accuracy.
+
+Run from the repository root:
+    python -m benchmarks.heston_scheme_convergence
+"""
+import time
+
+from numpy import exp, maximum, sqrt
+
+from src.options.heston_model.heston_model import HestonModel
+from src.processes.heston_process import HestonProcess
+
+# (name, s, k, t, v, r, theta, kappa, sigma, rho)
+PARAMETER_SETS = [
+    ('hest11', 150, 155, 15/365, 0.0105, 0.1, 0.0837, 74.32, 3.4532, -0.8912),
+    # Andersen (2008) case II, a long dated, high vol of vol set that is hard for Euler schemes.
+    ('andersen_ii', 100, 100, 5, 0.04, 0.0, 0.04, 0.3, 0.9, -0.5),
+]
+SCHEMES = ['euler', 'full_truncation', 'qe']
+TIME_STEPS = [1, 2, 4, 8, 16, 32, 64]
+SIMULATIONS = 200000
+SEED = 2020
+
+
+def convergence(name, s, k, t, v, r, theta, kappa, sigma, rho, simulations=SIMULATIONS, seed=SEED):
+    exact = HestonModel(s, k, t, v, r, theta, kappa, sigma, rho).european_call()
+    print("{}: semi-analytic call {:.6f}".format(name, exact))
+    print("{:>16} {:>6} {:>12} {:>10} {:>10} {:>8}".format('scheme', 'steps', 'price', 'bias', 'std err', 'seconds'))
+
+    for scheme in SCHEMES:
+        for time_steps in TIME_STEPS:
+            process = HestonProcess(s, k, t, v, r, theta, kappa, sigma, rho, seed=seed, scheme=scheme)
+            start = time.perf_counter()
+            (s_t, v_t) = process.diffusion_streaming(time_steps, simulations)
+            seconds = time.perf_counter() - start
+
+            payoff = maximum(s_t - k, 0) * exp(-r * t)
+            price = payoff.mean()
+            print("{:>16} {:>6} {:>12.6f} {:>10.6f} {:>10.6f} {:>8.3f}".format(
+                scheme, time_steps, price, price - exact, payoff.std() / sqrt(simulations), seconds))
+    print()
+
+
+if __name__ == '__main__':
+    for parameter_set in PARAMETER_SETS:
+        convergence(*parameter_set)
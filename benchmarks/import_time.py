@@ -0,0 +1,72 @@
+"""
+Import time of every library module, each imported in a fresh interpreter, and a guard that importing does not
+pull in the heavy optional dependencies. Worker processes import these modules on every fork, so the import
+time is paid once per worker.
+
+Run from the repository root, the exit code is 1 if a module is over its budget or loads a lazy dependency:
+    python -m benchmarks.import_time
+"""
+import json
+import subprocess
+import sys
+
+MODULES = [
+    'src.options.black_scholes.black_scholes',
+    'src.options.black_scholes.implied_volatility',
+    'src.options.black_scholes.graph_greeks',
+    'src.options.heston_model.cache',
+    'src.options.heston_model.heston_model',
+    'src.options.heston_model.surrogate',
+    'src.options.heston_model.heston_diffusion_model',
+    'src.options.heston_model.calibrate',
+    'src.options.heston_model.graph_greeks',
+    'src.options.parameter_sweep',
+    'src.processes.heston_process',
+    'src.processes.random_generators',
+    'src.market_data.quote_loader',
+    'src.instrumentation',
+    'src.risk.portfolio',
+    'src.risk.value_at_risk',
+    'src.risk.sensitivity_var',
+]
+# Only loaded by the methods that need them: plotting, reading quotes, adaptive quad, optimisers and QMC.
+LAZY_DEPENDENCIES = ['matplotlib', 'pandas', 'scipy.stats', 'scipy.integrate', 'scipy.interpolate',
+                     'scipy.optimize']
+# Seconds, roughly twice numpy + scipy.special on a laptop.
+BUDGET = 0.4
+REPEATS = 5
+
+MEASURE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+print(json.dumps({{'seconds': seconds, 'loaded': [name for name in {lazy!r} if name in sys.modules]}}))
+"""
+
+
+def import_time(module, repeats=REPEATS):
+    """
+    :return: best import time over the repeats, in seconds, and the lazy dependencies the import loaded.
+    """
+    runs = []
+    for i in range(repeats):
+        output = subprocess.run([sys.executable, '-c', MEASURE.format(module=module, lazy=LAZY_DEPENDENCIES)],
+                                capture_output=True, text=True, check=True).stdout
+        runs.append(json.loads(output.splitlines()[-1]))
+    return min(run['seconds'] for run in runs), runs[0]['loaded']
+
+
+def main():
+    failures = 0
+    print("{:<50} {:>8}  {}".format('module', 'seconds', 'lazy dependencies loaded'))
+    for module in MODULES:
+        (seconds, loaded) = import_time(module)
+        failed = seconds > BUDGET or bool(loaded)
+        failures += failed
+        print("{:<50} {:>8.3f}  {}{}".format(module, seconds, ', '.join(loaded) or '-', '  FAIL' if failed else ''))
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
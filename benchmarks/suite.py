@@ -0,0 +1,310 @@
+"""
+Timing suite of the pricers, Greeks, calibrators and simulators, on the demo parameter sets of src.examples and
+with fixed seeds, so two runs of the same commit on the same machine measure the same work.
+
+Each benchmark is timed as the best of REPEATS runs of a loop long enough to last about 0.2 s. The Monte Carlo
+benchmarks also report paths per second and the peak memory traced by tracemalloc, from one separate run as
+tracing slows everything down. The shared characteristic function cache of HestonModel is disabled, except in
+the benchmark of the cache itself, so that repeated runs do not just time cache hits.
+
+Results are written to benchmarks/results/<commit>.json and compared with an earlier results file measured on
+the same machine, the ratio of every time to the earlier one being printed and benchmarks slower by more than
+the threshold being flagged. Timings from another machine are not comparable, so such a file is skipped with a
+warning. No results are committed as they depend on the machine: the first run on a machine has nothing to
+compare with and becomes the baseline of the next ones. To create a baseline before changing anything, run the
+suite once on the commit to compare against, e.g. on a clean checkout of main.
+
+Run from the repository root:
+    python -m benchmarks.suite                      # every benchmark, compared with the latest results of this
+                                                    # machine
+    python -m benchmarks.suite --filter heston_call --compare benchmarks/results/2d26110.json
+    python -m benchmarks.suite --fail-on-regression  # exit code 1 if anything is slower than the threshold
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import timeit
+import tracemalloc
+from glob import glob
+from os.path import dirname, getmtime, join
+
+import numpy
+from numpy import array, linspace, newaxis, full
+
+from src import examples
+from src.options.black_scholes.black_scholes import BlackScholes
+from src.options.black_scholes.implied_volatility import ImpliedVolatility
+from src.options.heston_model import heston_model
+from src.options.heston_model.heston_model import HestonModel, PreparedHestonOption
+from src.processes.heston_process import HestonProcess
+
+RESULTS_DIRECTORY = join(dirname(__file__), 'results')
+REPEATS = 5
+SEED = 2020
+# Ratio to the earlier time above which a benchmark is reported as a regression.
+THRESHOLD = 1.2
+# (simulations, time steps) of the Monte Carlo benchmarks.
+SIMULATION_SIZES = [(10000, 50), (100000, 50), (1000000, 50)]
+
+
+def heston_strikes(parameters, n_strikes):
+    """
+    :return: the parameter set with n_strikes strikes from 80% to 120% of the spot in place of its strike.
+    """
+    return (parameters[0], linspace(0.8, 1.2, n_strikes) * parameters[0]) + tuple(parameters[2:])
+
+
+def heston_points(parameters, n_points):
+    """
+    :return: the parameter set as (n_points, 1) arrays, the spot running from 80% to 120% of its value.
+    """
+    columns = [full((n_points, 1), float(parameter)) for parameter in parameters]
+    columns[0] = linspace(0.8, 1.2, n_points)[:, newaxis] * parameters[0]
+    return columns
+
+
+def greeks_quad(model, option_type):
+    """
+    Every Greek from its own adaptive quad, the slow path that greeks_all replaces.
+    """
+    return [model.european_call(), model.greek_delta(option_type), model.greek_gamma(option_type),
+            model.greek_vega(option_type), model.greek_rho(option_type), model.greek_volga(option_type),
+            model.greek_vanna(option_type), model.greek_theta(option_type)]
+
+
+def calibration(optimisation_type):
+    from src.market_data.quote_loader import QuoteLoader
+    from src.options.heston_model.calibrate import CalibrateHeston
+
+    known = QuoteLoader().load(examples.CALIBRATION_DATA, sheet_name='Data')
+    calibration = CalibrateHeston(array(examples.CALIBRATION_INITIAL_GUESS), array(examples.CALIBRATION_BOUNDS),
+                                  known, optimisation_type, callback=lambda *arguments: None, seed=SEED)
+    return calibration.run_optimisation
+
+
+def simulation(simulations, time_steps, scheme):
+    def simulate():
+        process = HestonProcess(*examples.HEST11, seed=SEED, scheme=scheme)
+        return process.diffusion_streaming(time_steps, simulations)
+    return simulate
+
+
+def cached_gauss_call():
+    """
+    :return: the Gauss call of hest11 with the cache enabled only while it runs, every call after the first one
+        being a hit.
+    """
+    model = HestonModel(*examples.HEST11)
+
+    def call():
+        enabled = heston_model.CACHE.enabled
+        heston_model.CACHE.enabled = True
+        try:
+            return model.european_call(method='gauss')
+        finally:
+            heston_model.CACHE.enabled = enabled
+    return call
+
+
+def benchmarks():
+    """
+    :return: list of (name, function of no arguments, number of paths it simulates or None). Setting up the
+        models is done here, outside of the timed functions.
+    """
+    black_s = BlackScholes(*examples.BLACK_S)
+    hest11 = HestonModel(*examples.HEST11)
+    hest_2 = HestonModel(*examples.HEST_2)
+    hest11_strikes = HestonModel(*heston_strikes(examples.HEST11, 1000))
+    hest11_points = HestonModel(*heston_points(examples.HEST11, 1000))
+    prepared = PreparedHestonOption(hest11)
+
+    (s, k, t, sigma, d, r) = examples.BLACK_S
+    spots = linspace(0.8, 1.2, 100000) * s
+    implied_volatility = ImpliedVolatility(BlackScholes(spots, k, t, sigma, d, r).european_call(), spots, k, t, d,
+                                           r, 'call')
+
+    black_s_batch = BlackScholes(spots, k, t, sigma, d, r)
+
+    suite = [
+        ('black_scholes_call', black_s.european_call, None),
+        ('black_scholes_batch_100k', lambda: black_s_batch.european_batch('call'), None),
+        ('heston_call_quad_hest11', hest11.european_call, None),
+        ('heston_call_quad_hest_2', hest_2.european_call, None),
+        ('heston_call_gauss_hest11', lambda: hest11.european_call(method='gauss'), None),
+        ('heston_call_gauss_hest_2', lambda: hest_2.european_call(method='gauss'), None),
+        ('heston_call_gauss_cached', cached_gauss_call(), None),
+        ('heston_call_fft_1000_strikes', lambda: hest11.european_call_fft(hest11_strikes.k), None),
+        ('heston_put_cos_1000_strikes', lambda: hest11.european_put_cos(hest11_strikes.k), None),
+        ('heston_call_gauss_1000_strikes', lambda: hest11_strikes.european_call(method='gauss'), None),
+        ('heston_spot_tick', lambda: prepared.european_call(examples.HEST11[0] + 0.01), None),
+        ('heston_greeks_quad_hest11', lambda: greeks_quad(hest11, 'call'), None),
+        ('heston_greeks_all_hest11', lambda: hest11.greeks_all('call'), None),
+        ('heston_greeks_all_hest_2', lambda: hest_2.greeks_all('call'), None),
+        ('heston_greeks_all_1000_points', lambda: hest11_points.greeks_all('call'), None),
+        ('implied_volatility_100k', implied_volatility.solve, None),
+        ('calibration_least_squares', calibration('least_squares'), None),
+        ('calibration_local', calibration('local'), None),
+    ]
+    for (simulations, time_steps) in SIMULATION_SIZES:
+        for scheme in ('euler', 'qe'):
+            suite.append(('simulation_{}_{}x{}'.format(scheme, simulations, time_steps),
+                          simulation(simulations, time_steps, scheme), simulations))
+    return suite
+
+
+def time_benchmark(function, repeats=REPEATS):
+    """
+    :return: best time of one call over the repeats, in seconds, each repeat looping for at least 0.2 s.
+    """
+    timer = timeit.Timer(function)
+    (number, _) = timer.autorange()
+    return min(timer.repeat(repeat=repeats, number=number)) / number
+
+
+def peak_memory(function):
+    """
+    :return: peak memory allocated during one call, in bytes.
+    """
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def commit():
+    """
+    :return: short hash of HEAD, suffixed with -dirty if the tree has uncommitted changes.
+    """
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], capture_output=True, text=True,
+                              check=True, cwd=dirname(dirname(__file__) or '.')).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def machine():
+    """
+    :return: description of the machine and library versions the timings depend on.
+    """
+    return {'python': platform.python_version(), 'numpy': numpy.__version__, 'platform': platform.platform(),
+            'processor': platform.processor(), 'cpus': os.cpu_count()}
+
+
+def run(name_filter=None, repeats=REPEATS):
+    """
+    :return: dictionary keyed by benchmark of its seconds per call, and paths_per_second and peak_bytes for the
+        simulations.
+    """
+    enabled = heston_model.CACHE.enabled
+    heston_model.CACHE.enabled = False
+    try:
+        results = {}
+        for (name, function, paths) in benchmarks():
+            if name_filter is not None and name_filter not in name:
+                continue
+            result = {'seconds': time_benchmark(function, repeats)}
+            if paths is not None:
+                result['paths_per_second'] = paths / result['seconds']
+                result['peak_bytes'] = peak_memory(function)
+            results[name] = result
+            print("{:<40} {:>12.6g} s{}".format(name, result['seconds'], "  {:>12.4g} paths/s {:>10.1f} MB".format(
+                result['paths_per_second'], result['peak_bytes'] / 2**20) if paths is not None else ''))
+    finally:
+        heston_model.CACHE.enabled = enabled
+    return results
+
+
+def save(results, directory=RESULTS_DIRECTORY):
+    """
+    Writes the results with the commit and the machine they were measured on, one file per commit. Results of
+    an earlier, e.g. filtered, run of the same commit are kept unless measured again.
+
+    :return: path of the file.
+    """
+    os.makedirs(directory, exist_ok=True)
+    revision = commit()
+    path = join(directory, revision + '.json')
+    merged = {}
+    if os.path.exists(path):
+        with open(path) as source:
+            merged = json.load(source)['results']
+    merged.update(results)
+
+    with open(path, 'w') as output:
+        json.dump({
+            'commit': revision,
+            'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'machine': machine(),
+            'results': merged,
+        }, output, indent=2)
+    return path
+
+
+def compare(results, path, threshold=THRESHOLD):
+    """
+    Prints the ratio of every time to the time in an earlier results file. A file measured on another machine
+    is skipped with a warning, its timings not being comparable.
+
+    :return: names of the benchmarks slower than threshold times the earlier time.
+    """
+    with open(path) as source:
+        earlier = json.load(source)
+    if earlier['machine'] != machine():
+        print("\nwarning: {} was measured on another machine ({}), not comparing".format(path, earlier['machine']))
+        return []
+    print("\ncompared with {} measured on {}".format(earlier['commit'], earlier['date']))
+    regressions = []
+    for (name, result) in results.items():
+        if name not in earlier['results']:
+            continue
+        ratio = result['seconds'] / earlier['results'][name]['seconds']
+        if ratio > threshold:
+            regressions.append(name)
+        print("{:<40} {:>8.2f}x{}".format(name, ratio, '  SLOWER' if ratio > threshold else ''))
+    return regressions
+
+
+def latest_results(excluding, directory=RESULTS_DIRECTORY):
+    """
+    :return: the most recently written results file of this machine other than excluding, None if there is none.
+    """
+    paths = []
+    for path in glob(join(directory, '*.json')):
+        if os.path.abspath(path) == os.path.abspath(excluding):
+            continue
+        with open(path) as source:
+            if json.load(source)['machine'] == machine():
+                paths.append(path)
+    return max(paths, key=getmtime) if paths else None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.suite', description=__doc__.split('\n\n')[0])
+    parser.add_argument('--filter', default=None, help='only run benchmarks whose name contains this')
+    parser.add_argument('--repeats', type=int, default=REPEATS)
+    parser.add_argument('--compare', default=None, help='results file to compare with, the latest other one if '
+                                                        'not given')
+    parser.add_argument('--threshold', type=float, default=THRESHOLD)
+    parser.add_argument('--fail-on-regression', action='store_true')
+    arguments = parser.parse_args(argv)
+
+    results = run(arguments.filter, arguments.repeats)
+    path = save(results)
+    print("\nresults written to {}".format(path))
+
+    earlier = arguments.compare or latest_results(path)
+    if earlier is None:
+        print("no earlier results of this machine to compare with, these results are the baseline of the next run")
+        return 0
+    regressions = compare(results, earlier, arguments.threshold)
+    return 1 if regressions and arguments.fail_on_regression else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,154 @@
+"""
+Command line entry points, run from the repository root:
+
+    python -m src price --model heston --method gauss
+    python -m src greeks --model black_scholes --sweep s 120 190 1 --greek theta --plot
+    python -m src calibrate --type least_squares
+    python -m src simulate --simulations 100000 --time-steps 100 --scheme qe --antithetic
+
+Every subcommand imports the modules it needs when it runs, so the parser itself loads nothing heavy.
+"""
+import argparse
+
+from src import examples
+
+
+def model_class(name):
+    if name == 'heston':
+        from src.options.heston_model.heston_model import HestonModel
+        return HestonModel
+    from src.options.black_scholes.black_scholes import BlackScholes
+    return BlackScholes
+
+
+def default_parameters(arguments):
+    if arguments.parameters is not None:
+        return arguments.parameters
+    return examples.HEST11 if arguments.model == 'heston' else examples.BLACK_S
+
+
+def price(arguments):
+    option = model_class(arguments.model)(*default_parameters(arguments))
+    if arguments.model == 'black_scholes':
+        return option.european_call() if arguments.option_type == 'call' else option.european_put()
+    if arguments.method in ('quad', 'gauss'):
+        if arguments.option_type == 'call':
+            return option.european_call(method=arguments.method)
+        return option.european_put(method=arguments.method)
+    if arguments.method == 'fft':
+        return (option.european_call_fft if arguments.option_type == 'call' else option.european_put_fft)(
+            [option.k])[0]
+    return (option.european_call_cos if arguments.option_type == 'call' else option.european_put_cos)([option.k])[0]
+
+
+def greeks(arguments):
+    model = model_class(arguments.model)
+    parameters = default_parameters(arguments)
+    if arguments.sweep is None:
+        if arguments.model == 'heston':
+            return model(*parameters).greeks_all(arguments.option_type)
+        return model(*parameters).european_batch(arguments.option_type)
+
+    from numpy import arange
+    from src.options.parameter_sweep import ParameterSweep
+
+    (parameter, start, finish, step) = arguments.sweep
+    values = arange(float(start), float(finish) + float(step) / 2, float(step))
+    frame = ParameterSweep(model, parameters, arguments.option_type, workers=arguments.workers).frame(parameter,
+                                                                                                     values)
+    if arguments.plot:
+        from matplotlib import pyplot as plt
+
+        plt.plot(frame[parameter], frame[arguments.greek])
+        plt.xlabel(parameter)
+        plt.ylabel(arguments.greek)
+        plt.grid()
+        plt.show()
+    return frame
+
+
+def calibrate(arguments):
+    from numpy import array
+    from src.market_data.quote_loader import QuoteLoader
+    from src.options.heston_model.calibrate import CalibrateHeston
+
+    known = QuoteLoader().load(arguments.data, sheet_name=arguments.sheet)
+    calibration = CalibrateHeston(array(examples.CALIBRATION_INITIAL_GUESS), array(examples.CALIBRATION_BOUNDS),
+                                  known, arguments.type, graph='y' if arguments.plot else 'n',
+                                  workers=arguments.workers, seed=arguments.seed)
+    result = calibration.run_optimisation()
+    if arguments.plot:
+        from matplotlib import pyplot as plt
+        plt.show()
+    return result
+
+
+def simulate(arguments):
+    from src.options.heston_model.heston_diffusion_model import DiffusionHestonModel
+
+    model = DiffusionHestonModel(*(arguments.parameters or examples.HEST11), seed=arguments.seed,
+                                 scheme=arguments.scheme)
+    if arguments.plot:
+        return model.diffusion_model(arguments.simulations, arguments.time_steps, arguments.option_type,
+                                     graph='Yes')
+    return model.diffusion_model_statistics(arguments.simulations, arguments.time_steps, arguments.option_type,
+                                            antithetic=arguments.antithetic,
+                                            control_variate=arguments.control_variate)
+
+
+def parser():
+    main_parser = argparse.ArgumentParser(prog='python -m src', description=__doc__.split('\n\n')[0])
+    subparsers = main_parser.add_subparsers(dest='command', required=True)
+
+    def add_option_arguments(subparser, models=('heston', 'black_scholes')):
+        if len(models) > 1:
+            subparser.add_argument('--model', choices=models, default='heston')
+        subparser.add_argument('--option-type', choices=('call', 'put'), default='call')
+        subparser.add_argument('--parameters', type=float, nargs='+', default=None,
+                               help='constructor arguments of the model, (s, k, t, v, r, theta, kappa, sigma, rho) '
+                                    'for heston and (s, k, t, sigma, d, r) for black_scholes')
+
+    price_parser = subparsers.add_parser('price', help='price a European option')
+    add_option_arguments(price_parser)
+    price_parser.add_argument('--method', choices=('quad', 'gauss', 'fft', 'cos'), default='gauss',
+                              help='Heston pricing method')
+    price_parser.set_defaults(function=price)
+
+    greeks_parser = subparsers.add_parser('greeks', help='Greeks at a point or swept over a parameter')
+    add_option_arguments(greeks_parser)
+    greeks_parser.add_argument('--sweep', nargs=4, metavar=('PARAMETER', 'START', 'FINISH', 'STEP'), default=None)
+    greeks_parser.add_argument('--greek', default='delta', help='Greek to plot')
+    greeks_parser.add_argument('--plot', action='store_true')
+    greeks_parser.add_argument('--workers', type=int, default=1)
+    greeks_parser.set_defaults(function=greeks)
+
+    calibrate_parser = subparsers.add_parser('calibrate', help='calibrate the Heston model to quotes')
+    calibrate_parser.add_argument('--data', default=examples.CALIBRATION_DATA,
+                                  help='Excel or CSV file with columns s, k, t, r and c')
+    calibrate_parser.add_argument('--sheet', default='Data')
+    calibrate_parser.add_argument('--type', choices=('local', 'global', 'least_squares'), default='local')
+    calibrate_parser.add_argument('--plot', action='store_true')
+    calibrate_parser.add_argument('--workers', type=int, default=1)
+    calibrate_parser.add_argument('--seed', type=int, default=None)
+    calibrate_parser.set_defaults(function=calibrate)
+
+    simulate_parser = subparsers.add_parser('simulate', help='Monte Carlo price under the Heston diffusion')
+    add_option_arguments(simulate_parser, models=('heston',))
+    simulate_parser.add_argument('--simulations', type=int, default=100000)
+    simulate_parser.add_argument('--time-steps', type=int, default=100)
+    simulate_parser.add_argument('--scheme', choices=('euler', 'full_truncation', 'qe'), default='euler')
+    simulate_parser.add_argument('--seed', type=int, default=None)
+    simulate_parser.add_argument('--antithetic', action='store_true')
+    simulate_parser.add_argument('--control-variate', choices=('stock', 'european', 'both'), default=None)
+    simulate_parser.add_argument('--plot', action='store_true')
+    simulate_parser.set_defaults(function=simulate)
+    return main_parser
+
+
+def main(argv=None):
+    arguments = parser().parse_args(argv)
+    print(arguments.function(arguments))
+
+
+if __name__ == '__main__':
+    main()
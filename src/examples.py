@@ -0,0 +1,19 @@
+"""
+Parameter sets of the demos, used by the command line (python -m src) and the benchmarks. Only constants live
+here so importing it costs nothing.
+"""
+from os.path import dirname, join
+
+# BlackScholes(s, k, t, sigma, d, r)
+BLACK_S = (154.08, 155, 15/365, 0.2331, 0.0, 0.1)
+
+# HestonModel(s, k, t, v, r, theta, kappa, sigma, rho)
+HEST11 = (150, 155, 15/365, 0.0105, 0.1, 0.0837, 74.32, 3.4532, -0.8912)
+HEST_2 = (1, 2, 10, 0.16, 0, 0.16, 1, 2, -0.8)
+# Starting point of the Greek sweeps.
+HEST_GREEKS = (154.08, 155, 15/365, 0.0105, 0.1, 0.0837, 74.32, 3.4532, -0.8912)
+
+# initial_guess(v, theta, kappa, sigma, rho)
+CALIBRATION_INITIAL_GUESS = (0.09, 0.295, 0.9, 0.7, -0.2)
+CALIBRATION_BOUNDS = ((0, 1), (0, 1), (0, 5), (0, 5), (-1, 1))
+CALIBRATION_DATA = join(dirname(dirname(__file__)), 'data', 'Heston_Calibration_Data.xlsx')
@@ -0,0 +1,157 @@
+"""
+Opt-in metrics of the pricing hot paths: counters, summaries of observed values such as latencies, and a bounded
+log of structured events, all kept in REGISTRY.
+
+Nothing is recorded until enable() is called. The instrumented code checks the module level enabled flag before
+doing any work, so when it is off each hook costs one attribute lookup. The metrics are per process, worker
+processes of the parallel pricers keep their own.
+
+    from src import instrumentation
+    instrumentation.enable()
+    HestonModel(*examples.HEST11).european_call()
+    instrumentation.REGISTRY.snapshot()   # counters and summaries
+    instrumentation.REGISTRY.events       # e.g. the quad calls that returned a warning, with the model parameters
+
+Metrics recorded:
+    - heston.cf_calls, heston.cf_points: characteristic function evaluations and the phi values they covered.
+    - quad.evaluations, quad.subintervals, quad.error, quad.seconds: per adaptive integration, from scipy's
+    full_output, and a quad.warning event with the integrand's model parameters when scipy reports a problem.
+    - heston.<method>.seconds: latency of the Heston pricing methods.
+    - calibration.objective_evaluations, calibration.objective and a calibration.result event with the
+    optimiser's iterations, evaluations and wall time.
+    - simulation.paths_per_second, simulation.seconds and a simulation event per HestonProcess.diffusion_streaming.
+"""
+import time
+from collections import deque, defaultdict
+from threading import Lock
+
+enabled = False
+
+
+class Summary:
+
+    def __init__(self):
+        """
+        Count, total, minimum and maximum of the observed values, kept instead of the values themselves.
+        """
+        self.count = 0
+        self.total = 0.0
+        self.minimum = float('inf')
+        self.maximum = float('-inf')
+
+    def update(self, value):
+        self.count += 1
+        self.total += value
+        self.minimum = min(self.minimum, value)
+        self.maximum = max(self.maximum, value)
+
+    def mean(self):
+        return self.total / self.count if self.count else float('nan')
+
+    def as_dict(self):
+        return {'count': self.count, 'total': self.total, 'mean': self.mean(), 'min': self.minimum,
+                'max': self.maximum}
+
+
+class MetricsRegistry:
+
+    def __init__(self, max_events=10000):
+        """
+        :param max_events: number of most recent events kept.
+        """
+        self.counters = defaultdict(int)
+        self.summaries = defaultdict(Summary)
+        self.events = deque(maxlen=max_events)
+        self.listeners = []
+        self.lock = Lock()
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.counters[name] += value
+
+    def observe(self, name, value):
+        with self.lock:
+            self.summaries[name].update(value)
+
+    def event(self, name, **fields):
+        """
+        Records a structured event and passes it to every listener, e.g. a logger or a metrics exporter.
+        """
+        record = dict(fields, name=name, time=time.time())
+        with self.lock:
+            self.events.append(record)
+        for listener in self.listeners:
+            listener(record)
+
+    def add_listener(self, listener):
+        """
+        :param listener: function called with the dictionary of every event.
+        """
+        self.listeners.append(listener)
+
+    def snapshot(self):
+        """
+        :return: dictionary with the counters and the summaries as plain dictionaries.
+        """
+        with self.lock:
+            return {'counters': dict(self.counters),
+                    'summaries': {name: summary.as_dict() for (name, summary) in self.summaries.items()}}
+
+    def reset(self):
+        with self.lock:
+            self.counters.clear()
+            self.summaries.clear()
+            self.events.clear()
+
+
+REGISTRY = MetricsRegistry()
+
+
+class Timer:
+
+    def __init__(self, name):
+        """
+        Context manager observing the seconds spent in it as <name>.seconds.
+        """
+        self.name = name
+        self.seconds = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exception):
+        self.seconds = time.perf_counter() - self.start
+        REGISTRY.observe(self.name + '.seconds', self.seconds)
+        return False
+
+
+class NullTimer:
+
+    seconds = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        return False
+
+
+NULL_TIMER = NullTimer()
+
+
+def enable():
+    global enabled
+    enabled = True
+
+
+def disable():
+    global enabled
+    enabled = False
+
+
+def timer(name):
+    """
+    :return: a Timer for name when instrumentation is enabled, a shared context manager doing nothing otherwise.
+    """
+    return Timer(name) if enabled else NULL_TIMER
@@ -0,0 +1,85 @@
+import hashlib
+import os
+from os.path import abspath, basename, dirname, exists, join, splitext
+from tempfile import mkdtemp
+
+from numpy import ascontiguousarray, load, save
+
+
+def file_hash(path, sheet_name=None):
+    """
+    :return: SHA-256 of the file's contents and the sheet name.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as source:
+        for block in iter(lambda: source.read(1 << 20), b''):
+            digest.update(block)
+    # Sheets of a workbook share the file, so the sheet is part of the key.
+    digest.update(str(sheet_name).encode())
+    return digest.hexdigest()
+
+
+class QuoteLoader:
+
+    def __init__(self, cache_directory=None, columns=('s', 'k', 't', 'r', 'c')):
+        """
+        Loads option quotes from spreadsheets or CSVs as contiguous NumPy columns.
+
+        The first load of a file parses it and writes every column to its own .npy file in a directory named
+        after the hash of the file's contents. Later loads of the same contents, under any name, memory map
+        those columns instead of parsing, which takes milliseconds however slow the source format is. Editing
+        the file changes its hash, so a stale cache is never read.
+
+        :param cache_directory: where the columns are cached, a .quote_cache directory next to each source file
+            if None.
+        :param columns: columns that must be in the source, loaded as float64. Any other numeric column is kept too.
+        """
+        self.cache_directory = cache_directory
+        self.columns = columns
+
+    def cache_path(self, path, sheet_name=None):
+        directory = join(dirname(abspath(path)), '.quote_cache') if self.cache_directory is None \
+            else self.cache_directory
+        return join(directory, file_hash(path, sheet_name))
+
+    def parse(self, path, sheet_name=None):
+        """
+        :return: dict of the numeric columns of the source file as float64 arrays.
+        """
+        import pandas as pd
+
+        if splitext(path)[1].lower() in ('.xlsx', '.xlsm', '.xls'):
+            frame = pd.read_excel(path, sheet_name=sheet_name or 0)
+        else:
+            frame = pd.read_csv(path)
+
+        missing = [column for column in self.columns if column not in frame]
+        if missing:
+            raise ValueError("{} has no column {}".format(basename(path), ', '.join(missing)))
+        numeric = frame.select_dtypes('number')
+        return {str(column): ascontiguousarray(numeric[column], dtype=float) for column in numeric}
+
+    def load(self, path, sheet_name=None):
+        """
+        :param path: .xlsx or .csv file of quotes with at least the columns s, k, t, r and c.
+        :param sheet_name: sheet of a workbook, the first one if None.
+        :return: dict of read-only, memory mapped float64 columns, accepted as the known quotes of
+            CalibrateHeston.
+        """
+        cache = self.cache_path(path, sheet_name)
+        if not exists(cache):
+            columns = self.parse(path, sheet_name)
+            os.makedirs(dirname(cache), exist_ok=True)
+            # Written to a temporary directory and renamed, so a concurrent run never sees a partial cache.
+            staging = mkdtemp(dir=dirname(cache))
+            for (name, values) in columns.items():
+                save(join(staging, name + '.npy'), values)
+            try:
+                os.rename(staging, cache)
+            except OSError:
+                # Another process cached the same file first.
+                for name in os.listdir(staging):
+                    os.remove(join(staging, name))
+                os.rmdir(staging)
+
+        return {splitext(name)[0]: load(join(cache, name), mmap_mode='r') for name in sorted(os.listdir(cache))}
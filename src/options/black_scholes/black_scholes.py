@@ -1,6 +1,13 @@
 
 import numpy as np
-import scipy.stats as si
+from scipy.special import ndtr
+
+
+def norm_pdf(x):
+    """
+    The probability density function of the standard normal distribution.
+    """
+    return np.exp(-0.5 * x ** 2) / np.sqrt(2 * np.pi)
 
 
 class BlackScholes():
@@ -37,7 +44,7 @@ class BlackScholes():
         Calculate European Call Price based on the Black-Scholes models:
             The formula can be found here: https://en.wikipedia.org/wiki/Black%E2%80%93Scholes_model
 
-        :function si.norm.cdf: The cumulative distribution function of the standard normal distribution
+        :function ndtr: The cumulative distribution function of the standard normal distribution
         :param S:       Stock price of the underlying security
         :param K:       The strike price of the option, also frequently called exercise price.
         :param T:       Time to maturity in years.
@@ -46,8 +53,8 @@ class BlackScholes():
         :param r:       The risk free rate. An annual rate, expressed in terms of continuous compounding.
         :return:        The price of a European call option via the Black Scholes Model
         """
-        call_price = (self.s * np.exp(-self. d * self.t) * si.norm.cdf(self.d1_european_call())
-                      - self.k * np.exp(-self.r * self.t) * si.norm.cdf(self.d2_european_call()))
+        call_price = (self.s * np.exp(-self. d * self.t) * ndtr(self.d1_european_call())
+                      - self.k * np.exp(-self.r * self.t) * ndtr(self.d2_european_call()))
         return call_price
 
     def european_put(self):
@@ -55,7 +62,7 @@ class BlackScholes():
         Calculate European Put Price based on the Black-Scholes models:
             The formula can be found here: https://en.wikipedia.org/wiki/Black%E2%80%93Scholes_model
 
-        :function si.norm.cdf: The cumulative distribution function of the standard normal distribution
+        :function ndtr: The cumulative distribution function of the standard normal distribution
         :param S:       Stock price of the underlying security
         :param K:       The strike price of the option, also frequently called exercise price.
         :param T:       Time to maturity in years.
@@ -65,8 +72,8 @@ class BlackScholes():
         :return:        The price of a European put option via the Black Scholes Model
         """
 
-        put_price = (self.k * np.exp(-self.r * self.t) * si.norm.cdf(-self.d2_european_put())) \
-                    - (self.s * np.exp(-self. d * self.t) * si.norm.cdf(-self.d1_european_put()))
+        put_price = (self.k * np.exp(-self.r * self.t) * ndtr(-self.d2_european_put())) \
+                    - (self.s * np.exp(-self. d * self.t) * ndtr(-self.d1_european_put()))
         return put_price
 
     def greek_delta(self, option_type):
@@ -78,10 +85,10 @@ class BlackScholes():
         It can be interpreted as the probability of the option expiring in the money.
         """
         if option_type == "call":
-            delta = si.norm.cdf(self.d1_european_call())
+            delta = np.exp(-self.d * self.t) * ndtr(self.d1_european_call())
 
         elif option_type == "put":
-            delta = si.norm.cdf(self.d1_european_put()) - 1
+            delta = np.exp(-self.d * self.t) * (ndtr(self.d1_european_put()) - 1)
 
         return delta
 
@@ -96,7 +103,7 @@ class BlackScholes():
         elif option_type == "put":
             d1 = self.d1_european_put()
 
-        gamma = si.norm.pdf(d1) / (self.s * self.sigma * np.sqrt(self.t))
+        gamma = np.exp(-self.d * self.t) * norm_pdf(d1) / (self.s * self.sigma * np.sqrt(self.t))
 
         return gamma
 
@@ -111,32 +118,83 @@ class BlackScholes():
         elif option_type == "put":
             d1 = self.d1_european_put()
 
-        vega = self.s * si.norm.pdf(d1) * np.sqrt(self.t)
+        vega = self.s * np.exp(-self.d * self.t) * norm_pdf(d1) * np.sqrt(self.t)
         return vega
 
     def greek_rho(self, option_type):
         if option_type == "call":
-            rho = self.k * self.t * np.exp(-self. r * self.t) * si.norm.cdf(self.d2_european_call())
+            rho = self.k * self.t * np.exp(-self. r * self.t) * ndtr(self.d2_european_call())
 
         elif option_type == "put":
-            rho = -self.k * self.t * np.exp(-self.r * self.t) * si.norm.cdf(-self.d2_european_call())
+            rho = -self.k * self.t * np.exp(-self.r * self.t) * ndtr(-self.d2_european_call())
         return rho
 
     def greek_theta(self, option_type):
         if option_type == "call":
-            theta = (-np.exp(-self.d * self.t)) * (self.s * si.norm.pdf(self.d1_european_call()) * self.sigma) / \
-                    2 * np.sqrt(self.t) \
-                    - self.r * self.k * (np.exp(-self.r * self.t)) * si.norm.cdf(self.d2_european_call()) \
-                    + self.d * self.s * (np.exp(-self.d * self.t)) * si.norm.cdf(self.d1_european_call())
+            theta = (-np.exp(-self.d * self.t)) * (self.s * norm_pdf(self.d1_european_call()) * self.sigma) / \
+                    (2 * np.sqrt(self.t)) \
+                    - self.r * self.k * (np.exp(-self.r * self.t)) * ndtr(self.d2_european_call()) \
+                    + self.d * self.s * (np.exp(-self.d * self.t)) * ndtr(self.d1_european_call())
 
         elif option_type == "put":
-            theta = (-np.exp(-self.d * self.t)) * (self.s * si.norm.pdf(self.d1_european_put()) * self.sigma) / \
-                    2 * np.sqrt(self.t) \
-                    + self.r * self.k * (np.exp(-self.r * self.t)) * si.norm.cdf(- self.d2_european_put()) \
-                    - self.d * self.s * (np.exp(-self.d * self.t)) * si.norm.cdf(- self.d1_european_put())
+            theta = (-np.exp(-self.d * self.t)) * (self.s * norm_pdf(self.d1_european_put()) * self.sigma) / \
+                    (2 * np.sqrt(self.t)) \
+                    + self.r * self.k * (np.exp(-self.r * self.t)) * ndtr(- self.d2_european_put()) \
+                    - self.d * self.s * (np.exp(-self.d * self.t)) * ndtr(- self.d1_european_put())
 
         return theta
 
+    def european_batch(self, option_type):
+        """
+        Price and Greeks of a whole option chain in one vectorised evaluation.
+
+        The inputs given to the constructor can be NumPy arrays of any broadcastable shape, so a chain of
+        contracts is one object rather than one object per contract. d1, d2, the normal pdf and cdf are computed
+        once for the batch and shared by the price and every Greek.
+
+        :param option_type: either "call" or "put", or an array of them broadcastable against the inputs.
+        :return: dictionary of arrays with keys price, delta, gamma, vega, rho and theta.
+        """
+        s = np.asarray(self.s, dtype=float)
+        k = np.asarray(self.k, dtype=float)
+        t = np.asarray(self.t, dtype=float)
+        sigma = np.asarray(self.sigma, dtype=float)
+        d = np.asarray(self.d, dtype=float)
+        r = np.asarray(self.r, dtype=float)
+        is_call = np.asarray(option_type) == "call"
+
+        sqrt_t = np.sqrt(t)
+        sigma_sqrt_t = sigma * sqrt_t
+        d1 = (np.log(s / k) + (r - d + 0.5 * sigma ** 2) * t) / sigma_sqrt_t
+        d2 = d1 - sigma_sqrt_t
+
+        # N(-x) is evaluated directly rather than as 1 - N(x) so deep out of the money puts keep their precision.
+        pdf_d1 = norm_pdf(d1)
+        cdf_d1 = ndtr(d1)
+        cdf_d2 = ndtr(d2)
+        cdf_minus_d1 = ndtr(-d1)
+        cdf_minus_d2 = ndtr(-d2)
+
+        dividend_discount = np.exp(-d * t)
+        discount = np.exp(-r * t)
+        discounted_s = s * dividend_discount
+        discounted_k = k * discount
+
+        call_price = discounted_s * cdf_d1 - discounted_k * cdf_d2
+        put_price = discounted_k * cdf_minus_d2 - discounted_s * cdf_minus_d1
+
+        gamma = dividend_discount * pdf_d1 / (s * sigma_sqrt_t)
+        vega = discounted_s * pdf_d1 * sqrt_t
+        time_decay = -discounted_s * pdf_d1 * sigma / (2 * sqrt_t)
+
+        return {
+            "price": np.where(is_call, call_price, put_price),
+            "delta": np.where(is_call, dividend_discount * cdf_d1, -dividend_discount * cdf_minus_d1),
+            "gamma": gamma,
+            "vega": vega,
+            "rho": np.where(is_call, discounted_k * t * cdf_d2, -discounted_k * t * cdf_minus_d2),
+            "theta": np.where(is_call,
+                              time_decay - r * discounted_k * cdf_d2 + d * discounted_s * cdf_d1,
+                              time_decay + r * discounted_k * cdf_minus_d2 - d * discounted_s * cdf_minus_d1),
+        }
 
-BlackS = BlackScholes(154.08, 155, 15/365, 0.2331, 0.0, 0.1)
-BlackS.greek_gamma('call')
\ No newline at end of file
@@ -0,0 +1,119 @@
+import numpy as np
+from scipy.special import ndtr
+
+
+class ImpliedVolatility():
+
+    def __init__(self, price, s, k, t, d, r, option_type):
+        """
+        Black-Scholes implied volatilities of a whole array of quotes at once.
+
+        :param price:       Option prices, any broadcastable shape.
+        :param s:           Stock price of the underlying security
+        :param k:           The strike price of the option.
+        :param t:           Time to maturity in years.
+        :param d:           The dividend yield, continuously compounded.
+        :param r:           The risk free rate, continuously compounded.
+        :param option_type: either "call" or "put", or an array of them.
+        """
+        self.price = price
+        self.s = s
+        self.k = k
+        self.t = t
+        self.d = d
+        self.r = r
+        self.option_type = option_type
+
+    def out_of_the_money_price(self):
+        """
+        Undiscounted forward, strike and out of the money price of every quote. The out of the money option,
+        a call above the forward and a put below it, has no intrinsic value, which keeps deep in the money quotes
+        from losing their time value to rounding. The in the money quotes are converted by put-call parity,
+        C - P = F - K in forward terms.
+
+        :return: forward, strike, price, whether it is a call and time to maturity, as flat float arrays.
+        """
+        (price, s, k, t, d, r, option_type) = (array.ravel() for array in np.broadcast_arrays(
+            np.asarray(self.price, dtype=float), np.asarray(self.s, dtype=float), np.asarray(self.k, dtype=float),
+            np.asarray(self.t, dtype=float), np.asarray(self.d, dtype=float), np.asarray(self.r, dtype=float),
+            np.asarray(self.option_type)))
+        forward = s * np.exp((r - d) * t)
+        undiscounted = price * np.exp(r * t)
+        is_call = option_type == "call"
+
+        otm_call = k >= forward
+        # Intrinsic value in forward terms of the quoted option, taken off when it is in the money.
+        parity = np.where(is_call, forward - k, k - forward)
+        otm_price = np.where(is_call == otm_call, undiscounted, undiscounted - parity)
+        return forward, k, otm_price, otm_call, t
+
+    def solve(self, tolerance=1e-12, max_iterations=50):
+        """
+        Vectorised Householder (Halley) iteration on the total volatility w = sigma * sqrt(t).
+
+        - Initial guess: Corrado & Miller's (1996) quadratic approximation, which is close around the money.
+        - Every quote keeps a bracket [low, high] of w from the sign of the pricing error. Steps falling outside
+          it, which happens in the flat deep in or out of the money wings, are replaced by bisection, so every
+          quote converges.
+        - Halley's step uses f' = vega = F * pdf(d1) and f'' = vega * d1 * d2 / w, so each iteration costs one
+          pricing per quote and converges cubically near the root.
+        - Only the quotes that have not converged are carried to the next iteration.
+
+        Quotes outside the no-arbitrage bounds, an out of the money price that is not positive or not below the
+        forward (calls) or strike (puts), or with t <= 0, have no implied volatility and are NaN.
+
+        :param tolerance: pricing error, relative to the strike, at which a quote has converged.
+        :param max_iterations: maximum number of iterations.
+        :return: the implied volatilities, with the broadcast shape of the inputs.
+        """
+        shape = np.broadcast(np.asarray(self.price), np.asarray(self.s), np.asarray(self.k), np.asarray(self.t),
+                             np.asarray(self.d), np.asarray(self.r), np.asarray(self.option_type)).shape
+        (forward, k, target, is_call, t) = self.out_of_the_money_price()
+
+        upper_bound = np.where(is_call, forward, k)
+        valid = (target > 0) & (target < upper_bound) & (t > 0) & np.isfinite(target)
+        w = np.full(target.shape, np.nan)
+
+        active = np.flatnonzero(valid)
+        (f_a, k_a, c_a, call_a) = (forward[active], k[active], target[active], is_call[active])
+        x = np.log(f_a / k_a)
+
+        # Corrado-Miller in forward terms, the in the money call price gives the same guess as the out of the money
+        # price by parity.
+        call_price = np.where(call_a, c_a, c_a + f_a - k_a)
+        half_moneyness = 0.5 * (f_a - k_a)
+        root = np.sqrt(np.maximum((call_price - half_moneyness)**2 - (f_a - k_a)**2 / np.pi, 0))
+        guess = np.sqrt(2 * np.pi) / (f_a + k_a) * (call_price - half_moneyness + root)
+        low = np.zeros(len(active))
+        high = np.full(len(active), 50.0)
+        w_a = np.where((guess > 0) & (guess < high), guess, 1.0)
+
+        for iteration in range(max_iterations):
+            d1 = x / w_a + 0.5 * w_a
+            d2 = d1 - w_a
+            price = np.where(call_a, f_a * ndtr(d1) - k_a * ndtr(d2), k_a * ndtr(-d2) - f_a * ndtr(-d1))
+            error = price - c_a
+            vega = f_a * np.exp(-0.5 * d1**2) / np.sqrt(2 * np.pi)
+
+            converged = np.abs(error) <= tolerance * k_a
+            w[active[converged]] = w_a[converged]
+            keep = ~converged
+            if not keep.any():
+                break
+            (active, f_a, k_a, c_a, call_a, x, w_a, low, high, error, vega, d1, d2) = (
+                array[keep] for array in (active, f_a, k_a, c_a, call_a, x, w_a, low, high, error, vega, d1, d2))
+
+            # The price increases with w, so the sign of the error moves one end of the bracket.
+            high = np.where(error > 0, w_a, high)
+            low = np.where(error > 0, low, w_a)
+
+            with np.errstate(divide='ignore', invalid='ignore'):
+                newton = error / vega
+                step = newton / (1 - 0.5 * newton * d1 * d2 / w_a)
+                w_next = w_a - step
+            w_a = np.where(np.isfinite(w_next) & (w_next > low) & (w_next < high), w_next, 0.5 * (low + high))
+        else:
+            # Quotes left after max_iterations keep their last iterate.
+            w[active] = w_a
+
+        return (w / np.sqrt(t)).reshape(shape)
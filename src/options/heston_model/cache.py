@@ -0,0 +1,135 @@
+import sys
+from collections import OrderedDict
+from threading import Lock
+from numpy import asarray, ndarray
+
+# Bytes an entry costs on top of its key and value: its slot in the OrderedDict's hash table and linked list,
+# and the (value, size) tuple it is stored as.
+ENTRY_OVERHEAD = 200
+
+
+def parameter_key(*values):
+    """
+    :return: hashable key of scalars and arrays, equal for equal values whatever their Python type.
+    """
+    key = []
+    for value in values:
+        value = asarray(value, dtype=float)
+        key.append((value.shape, value.tobytes()))
+    return tuple(key)
+
+
+def size_in_bytes(value):
+    """
+    :return: memory held by a cached key or value: the objects themselves, nested tuples and lists included,
+        and the data of arrays, which a read-only view does not count as its own.
+    """
+    if isinstance(value, ndarray):
+        return sys.getsizeof(value) + (value.nbytes if value.base is not None else 0)
+    if isinstance(value, (tuple, list)):
+        return sys.getsizeof(value) + sum(size_in_bytes(item) for item in value)
+    return sys.getsizeof(value)
+
+
+def read_only(value):
+    """
+    :return: the value with every array replaced by a read-only view, so callers cannot change a cached entry.
+        The view leaves the array it was made from, which may be the caller's, writable.
+    """
+    if isinstance(value, ndarray):
+        view = value.view()
+        view.flags.writeable = False
+        return view
+    if isinstance(value, tuple):
+        return tuple(read_only(item) for item in value)
+    return value
+
+
+class LRUCache:
+
+    def __init__(self, max_bytes=64 * 2**20, max_entries=None):
+        """
+        Least recently used cache of values computed from the model parameters, bounded by the memory its
+        entries hold rather than by a number of entries.
+
+        HestonModel keeps its characteristic function node vectors and its P1, P2 integrals here, keyed on the
+        parameters they depend on. A model rebuilt with the same parameters, as in calibration and sweep loops,
+        or a put priced after a call on the same model, is then served without evaluating the characteristic
+        function again.
+
+        :param max_bytes: memory of the cached entries, keys, values and bookkeeping included, above which the
+            least recently used entries are evicted.
+        :param max_entries: largest number of entries, unbounded if None.
+        """
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.enabled = True
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get_or_compute(self, key, compute):
+        """
+        :param key: hashable key, see parameter_key.
+        :param compute: function of no arguments returning the value on a miss.
+        :return: the cached value, arrays being read-only.
+        """
+        if not self.enabled:
+            return compute()
+
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key][0]
+            self.misses += 1
+
+        # Computed outside the lock, two threads missing on the same key both compute it and the second one wins.
+        value = read_only(compute())
+        size = size_in_bytes(key) + size_in_bytes(value) + ENTRY_OVERHEAD
+        if size > self.max_bytes:
+            return value
+
+        with self.lock:
+            if key in self.entries:
+                self.bytes -= self.entries.pop(key)[1]
+            self.entries[key] = (value, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes or \
+                    (self.max_entries is not None and len(self.entries) > self.max_entries):
+                (_, (_, evicted_size)) = self.entries.popitem(last=False)
+                self.bytes -= evicted_size
+                self.evictions += 1
+        return value
+
+    def clear(self):
+        """
+        Drops every entry and resets the statistics.
+        """
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def statistics(self):
+        """
+        :return: dictionary with hits, misses, hit_rate, evictions, entries and bytes.
+        """
+        with self.lock:
+            requests = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / requests if requests else 0.0,
+                'evictions': self.evictions,
+                'entries': len(self.entries),
+                'bytes': self.bytes,
+            }
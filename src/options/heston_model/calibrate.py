@@ -1,77 +1,235 @@
-from scipy.optimize import minimize, differential_evolution
+from concurrent.futures import ProcessPoolExecutor
+from src import instrumentation
 from src.options.heston_model.heston_model import HestonModel
-from numpy import array, linspace, meshgrid
-from scipy.interpolate import griddata
+from numpy import array, linspace, meshgrid, ascontiguousarray, column_stack, unique, empty, flatnonzero, asarray, \
+    array_split, concatenate, newaxis, isfinite
+
+# The CalibrateHeston of a worker process of the global optimisation, see initialise_worker.
+worker_calibration = None
+
+
+def initialise_worker(calibration):
+    """
+    Runs once in every worker process, so the quotes and maturity groups are sent to each worker once rather
+    than with every chunk of every generation.
+    """
+    global worker_calibration
+    worker_calibration = calibration
+
+
+def worker_price_quotes(guesses):
+    return worker_calibration.price_quotes(guesses)
 
-import pandas as pd
-import matplotlib.pyplot as plt
-from mpl_toolkits import mplot3d
 
 class CalibrateHeston:
-    def __init__(self, initial_guess, bounds, known, optmisation_type, graph="n"):
+    def __init__(self, initial_guess, bounds, known, optmisation_type, graph="n", callback=None, workers=1,
+                 seed=None):
         """
             :param v: volatility
             :param theta: long run average volatility (vbar)
             :param kappa: mean reversion (speed) of variance to long run average
             :param sigma: volatility of volatility (vvol)
             :param rho: correlation between the brownian motion of the stock price and the volatility.
+
+            :param known: quotes with columns s, r, t, k and c, any number of rows.
+            :param callback: optional function called as callback(guess, predicted_prices, objective) on every
+                objective evaluation, in place of printing.
+            :param workers: number of processes the global optimisation prices each generation with.
+            :param seed: seed of the global optimisation, the result does not depend on the number of workers.
         """
-        self.known_s = known['s']
-        self.known_r = known['r']
-        self.known_t = known['t']
-        self.known_k = known['k']
-        self.known_c = known['c']
+        self.known_s = ascontiguousarray(known['s'], dtype=float)
+        self.known_r = ascontiguousarray(known['r'], dtype=float)
+        self.known_t = ascontiguousarray(known['t'], dtype=float)
+        self.known_k = ascontiguousarray(known['k'], dtype=float)
+        self.known_c = ascontiguousarray(known['c'], dtype=float)
+
+        # Quotes sharing a spot, maturity and rate share the strike independent part of the characteristic
+        # function, so each group is priced with one evaluation over all of its strikes.
+        (_, group_of_quote) = unique(column_stack((self.known_s, self.known_t, self.known_r)), axis=0,
+                                     return_inverse=True)
+        self.maturity_groups = [flatnonzero(group_of_quote.ravel() == group)
+                                for group in range(group_of_quote.max() + 1)]
 
         self.initial_guess = initial_guess
         self.bounds = bounds
         self.optimisation_type = optmisation_type
         self.graph = graph
-    def objective(self, guess):
-        sum_of_relative_difference = 0
-        # HestonModel(s, k, t, v, r, theta, kappa, sigma, rho)
-        for i in range(0, 8):
+        self.callback = callback
+        self.workers = workers
+        self.seed = seed
 
-            heston = HestonModel(self.known_s[i], self.known_k[i], self.known_t[i], guess[0], self.known_r[i],
-                                 guess[1], guess[2], guess[3], guess[4])
+    def __getstate__(self):
+        # Worker processes only price, the callback stays in the parent and may not be picklable.
+        state = self.__dict__.copy()
+        state['callback'] = None
+        return state
 
-            pred_price = heston.european_call()
-            print("Predicted Price {}".format(pred_price))
-            print("Predicted Params {}".format(guess))
+    def price_quotes(self, guess):
+        """
+        :param guess: (v, theta, kappa, sigma, rho), or an array of shape (5, S) with one parameter set per column.
+        :return: Heston call prices of every quote in the order of the quotes, of shape (S, quotes) for S sets.
+        """
+        guess = asarray(guess, dtype=float)
+        (v, theta, kappa, sigma, rho) = guess[..., newaxis] if guess.ndim == 2 else guess
+        pred_prices = empty(guess.shape[1:] + self.known_c.shape)
+        # HestonModel(s, k, t, v, r, theta, kappa, sigma, rho)
+        for quotes in self.maturity_groups:
+            heston = HestonModel(self.known_s[quotes[0]], self.known_k[quotes], self.known_t[quotes[0]], v,
+                                 self.known_r[quotes[0]], theta, kappa, sigma, rho)
+            pred_prices[..., quotes] = heston.european_call(method='gauss')
+        return pred_prices
 
-            actual_price = self.known_c[i]
-            print("Diff {}".format(actual_price - pred_price))
-            trade_abs_difference = abs(actual_price - pred_price)
-            trade_relative_difference = trade_abs_difference/actual_price
+    def record_prices(self, guess, pred_prices):
+        """
+        Counts the evaluations and reports the non finite prices of model_prices, when instrumentation is enabled.
+        """
+        guess = asarray(guess, dtype=float)
+        if instrumentation.enabled:
+            instrumentation.REGISTRY.count('calibration.objective_evaluations',
+                                           guess.shape[1] if guess.ndim == 2 else 1)
+            failed = ~isfinite(pred_prices)
+            if failed.any():
+                # Parameter sets and quotes whose price is nan or infinite, the ones that make calibration blow up.
+                instrumentation.REGISTRY.event('calibration.non_finite_prices', guess=guess.tolist(),
+                                               quotes=flatnonzero(failed.any(axis=tuple(range(failed.ndim - 1))))
+                                               .tolist())
+
+    def model_prices(self, guess):
+        """
+        :return: price_quotes of the guess, recorded by record_prices.
+        """
+        pred_prices = self.price_quotes(guess)
+        self.record_prices(guess, pred_prices)
+        return pred_prices
 
-            sum_of_relative_difference = sum_of_relative_difference + trade_relative_difference
+    def objective(self, guess):
+        pred_prices = self.model_prices(guess)
+        sum_of_relative_difference = (abs(self.known_c - pred_prices) / self.known_c).sum()
 
-            print("Sum of rel difference {}".format(sum_of_relative_difference))
+        if instrumentation.enabled:
+            instrumentation.REGISTRY.observe('calibration.objective', sum_of_relative_difference)
+        if self.callback is not None:
+            self.callback(guess, pred_prices, sum_of_relative_difference)
         return sum_of_relative_difference
 
+    def model_jacobian(self, guess):
+        """
+        :param guess: (v, theta, kappa, sigma, rho)
+        :return: analytic derivatives of every quote's Heston price with respect to the guess, one row per quote.
+        """
+        jacobian = empty((len(self.known_c), 5))
+        for quotes in self.maturity_groups:
+            heston = HestonModel(self.known_s[quotes[0]], self.known_k[quotes], self.known_t[quotes[0]], guess[0],
+                                 self.known_r[quotes[0]], guess[1], guess[2], guess[3], guess[4])
+            jacobian[quotes] = heston.european_call_gradient().T
+        return jacobian
+
+    def residuals(self, guess):
+        """
+        Relative pricing errors of every quote, the least squares counterpart of objective.
+        """
+        pred_prices = self.model_prices(guess)
+        relative_difference = (pred_prices - self.known_c) / self.known_c
+
+        if instrumentation.enabled:
+            instrumentation.REGISTRY.observe('calibration.objective', abs(relative_difference).sum())
+        if self.callback is not None:
+            self.callback(guess, pred_prices, abs(relative_difference).sum())
+        return relative_difference
+
+    def residuals_jacobian(self, guess):
+        return self.model_jacobian(guess) / self.known_c[:, None]
+
+    def least_squares_optimisation(self, method='trf'):
+        """
+        Least squares calibration with the analytic Jacobian, so no full surface repricings are spent on finite
+        differences. 'trf' is a trust region Levenberg-Marquardt variant that respects the bounds, 'lm' is the
+        classic MINPACK Levenberg-Marquardt and ignores them.
+        """
+        from scipy.optimize import least_squares
+
+        if method == 'lm':
+            return least_squares(self.residuals, self.initial_guess, jac=self.residuals_jacobian, method='lm')
+        (lower, upper) = array(self.bounds, dtype=float).T
+        return least_squares(self.residuals, self.initial_guess, jac=self.residuals_jacobian, bounds=(lower, upper),
+                             method=method)
+
     def local_optimisation(self):
+        from scipy.optimize import minimize
+
         result = minimize(self.objective, self.initial_guess, bounds=self.bounds, tol=0.05)
         return result
 
+    def objective_population(self, guesses):
+        """
+        :param guesses: array of shape (5, S), one candidate per column, as differential_evolution passes them
+            when vectorized=True. The whole population is priced in one batched evaluation per maturity.
+            A single candidate of shape (5,) is also accepted.
+        :return: the objective of every candidate.
+        """
+        guesses = asarray(guesses, dtype=float)
+        if guesses.ndim == 1:
+            return self.objective(guesses)
+
+        return self.population_objective(guesses, self.model_prices(guesses))
+
+    def population_objective(self, guesses, pred_prices):
+        """
+        :param guesses: array of shape (5, S), one candidate per column.
+        :param pred_prices: their model prices, of shape (S, quotes).
+        :return: the objective of every candidate, each one observed and passed to the callback like in objective.
+        """
+        sum_of_relative_difference = (abs(self.known_c - pred_prices) / self.known_c).sum(axis=-1)
+
+        if instrumentation.enabled:
+            for objective in sum_of_relative_difference:
+                instrumentation.REGISTRY.observe('calibration.objective', objective)
+        if self.callback is not None:
+            for (guess, prices, objective) in zip(guesses.T, pred_prices, sum_of_relative_difference):
+                self.callback(guess, prices, objective)
+        return sum_of_relative_difference
+
     def global_optimisation(self):
-        result = differential_evolution(self.objective, self.bounds)
-        return result
+        """
+        Differential evolution that hands a whole generation to the objective at once (vectorized, deferred
+        updating). With more than one worker the generation is split into one chunk per process, the workers
+        receiving the quotes once when they start and only the candidates of each chunk after that. Workers only
+        price, the metrics and callbacks are recorded in this process, as with a single worker. The population
+        and its evaluation order do not depend on the number of workers, so a given seed gives the same result
+        on any machine.
+        """
+        from scipy.optimize import differential_evolution
 
-    def graph_output(self, result):
+        if self.workers == 1:
+            return differential_evolution(self.objective_population, self.bounds, seed=self.seed, vectorized=True,
+                                          updating='deferred')
 
-        [v_calibrated, theta_calibrated, kappa_calibrated, sigma_calibrated, rho_calibrated] = result.x
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=initialise_worker,
+                                 initargs=(self,)) as pool:
+            def objective_generation(guesses):
+                if guesses.ndim == 1:
+                    return self.objective(guesses)
+                chunks = array_split(guesses, self.workers, axis=1)
+                pred_prices = concatenate(list(pool.map(worker_price_quotes, chunks)))
+                self.record_prices(guesses, pred_prices)
+                return self.population_objective(guesses, pred_prices)
 
-        call_price = []
-        strike_price = []
-        maturity = []
+            result = differential_evolution(objective_generation, self.bounds, seed=self.seed, vectorized=True,
+                                            updating='deferred')
+        return result
 
-        for i in range(0, 8):
+    def graph_output(self, result):
+        from scipy.interpolate import griddata
+        import matplotlib.pyplot as plt
+        # Registers the '3d' projection.
+        from mpl_toolkits import mplot3d
 
-            heston = HestonModel(self.known_s[i], self.known_k[i], self.known_t[i], v_calibrated, self.known_r[i],
-                                 theta_calibrated, kappa_calibrated, sigma_calibrated, rho_calibrated)
+        [v_calibrated, theta_calibrated, kappa_calibrated, sigma_calibrated, rho_calibrated] = result.x
 
-            call_price.append(heston.european_call())
-            strike_price.append(self.known_k[i])
-            maturity.append(self.known_t[i])
+        call_price = self.model_prices([v_calibrated, theta_calibrated, kappa_calibrated, sigma_calibrated,
+                                        rho_calibrated])
+        strike_price = self.known_k
+        maturity = self.known_t
 
         # fig.plot3D(strike_price, maturity, call_price, 'gray')
         plotx, ploty = meshgrid(linspace(min(maturity), max(maturity), 10), linspace(min(strike_price), max(strike_price), 10))
@@ -86,27 +244,19 @@ class CalibrateHeston:
         fig.set_zlabel('Call Price')
 
     def run_optimisation(self):
-        if self.optimisation_type == 'local':
-
-            result = self.local_optimisation()
-            if self.graph == "y":
-                self.graph_output(result)
-            return result
-        elif self.optimisation_type == 'global':
-            result = self.global_optimisation()
-            if self.graph == "y":
-                self.graph_output(result)
-            return result
-        else:
-            return print('Optimisation type should be local or global')
-
-# initial_guess(v, theta, kappa, sigma, rho)
-initial_guess = array([0.09, 0.295, 0.9, 0.7, -0.2])
-bounds = array([(0, 1), (0, 1), (0, 5), (0, 5), (-1, 1)])
-
-# s0, v0, theta, kappa, sigma, r, rho, t, k)
-known = pd.read_excel(r"C:\Users\rp413vx\PycharmProjects\VaR_NEW\data\Heston_Calibration_Data.xlsx",sheet_name="Data")
-
-
-cali = CalibrateHeston(initial_guess, bounds, known, 'local', graph='y')
-output = cali.run_optimisation()
+        optimisations = {'local': self.local_optimisation, 'global': self.global_optimisation,
+                         'least_squares': self.least_squares_optimisation}
+        if self.optimisation_type not in optimisations:
+            return print('Optimisation type should be local, global or least_squares')
+
+        with instrumentation.timer('calibration') as timer:
+            result = optimisations[self.optimisation_type]()
+        if instrumentation.enabled:
+            instrumentation.REGISTRY.event('calibration.result', optimisation_type=self.optimisation_type,
+                                           success=bool(result.success), iterations=getattr(result, 'nit', None),
+                                           evaluations=getattr(result, 'nfev', None),
+                                           jacobian_evaluations=getattr(result, 'njev', None),
+                                           x=result.x.tolist(), seconds=timer.seconds, message=str(result.message))
+        if self.graph == "y":
+            self.graph_output(result)
+        return result
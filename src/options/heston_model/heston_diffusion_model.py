@@ -1,10 +1,49 @@
+from concurrent.futures import ProcessPoolExecutor
+from copy import deepcopy
 from src.processes.heston_process import HestonProcess
-from numpy import mean, exp, maximum, arange
-from matplotlib import pyplot as plt
+from src.processes.random_generators import PseudoRandomGenerator, SobolGenerator
+from src.options.heston_model.heston_model import HestonModel
+from numpy import mean, exp, maximum, linspace, sqrt, column_stack, array, random, isclose, inf
+from numpy.linalg import lstsq
+
+
+class RunningMoments:
+
+    def __init__(self):
+        """
+        Streaming count, mean and sum of squared deviations (M2) of samples, updated batch by batch and merged
+        with Chan et al.'s pairwise formulas, so a simulation never has to hold all its samples.
+        """
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def update(self, samples):
+        """
+        :param samples: array of samples along axis 0, a sample may itself be an array.
+        """
+        batch = RunningMoments()
+        batch.count = len(samples)
+        batch.mean = samples.mean(axis=0)
+        batch.m2 = ((samples - batch.mean)**2).sum(axis=0)
+        self.merge(batch)
+
+    def merge(self, other):
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean = self.mean + delta * other.count / count
+        self.m2 = self.m2 + other.m2 + delta**2 * self.count * other.count / count
+        self.count = count
+
+    def variance(self):
+        return self.m2 / (self.count - 1)
+
+    def standard_error(self):
+        return sqrt(self.variance() / self.count)
 
 
 class DiffusionHestonModel:
-    def __init__(self, s, k, t, v, r, theta, kappa, sigma, rho):
+    def __init__(self, s, k, t, v, r, theta, kappa, sigma, rho, seed=None, scheme='euler', generator=None):
         """
         :param s: stock price
         :param k: strike price
@@ -15,6 +54,9 @@ class DiffusionHestonModel:
         :param kappa: mean reversion (speed) of variance to long run average
         :param sigma: volatility of volatility (vvol)
         :param rho: correlation between the brownian motion of the stock price and the volatility.
+        :param seed: seed of the simulation's random number generator.
+        :param scheme: variance discretisation, 'euler', 'full_truncation' or 'qe', see HestonProcess.
+        :param generator: source of the normals, e.g. a SobolGenerator, pseudo-random if None.
         """
         self.s = s
         self.k = k
@@ -25,22 +67,52 @@ class DiffusionHestonModel:
         self.kappa = kappa
         self.sigma = sigma
         self.rho = rho
+        self.seed = seed
+        self.scheme = scheme
+        self.generator = generator
 
-    def diffusion_model(self, simulations, time_steps, option_type, graph='No'):
-        model_inputs = HestonProcess(s=self.s,
-                                     k=self.k,
-                                     t=self.t,
-                                     v=self.v,
-                                     r=self.r,
-                                     theta=self.theta,
-                                     kappa=self.kappa,
-                                     sigma=self.sigma,
-                                     rho=self.rho)
-        (s, v) = model_inputs.diffusion(simulations, time_steps)
+    def process(self, generator=None):
+        return HestonProcess(s=self.s,
+                             k=self.k,
+                             t=self.t,
+                             v=self.v,
+                             r=self.r,
+                             theta=self.theta,
+                             kappa=self.kappa,
+                             sigma=self.sigma,
+                             rho=self.rho,
+                             seed=self.seed,
+                             scheme=self.scheme,
+                             generator=self.generator if generator is None else generator)
+
+    def payoff(self, s_t, option_type, k=None):
+        """
+        :return: discounted payoff of a European option for terminal stock prices s_t.
+        """
+        k = self.k if k is None else k
+        if option_type == 'call':
+            return maximum(s_t - k, 0) * exp(-self.r * self.t)
+        elif option_type == 'put':
+            return maximum(k - s_t, 0) * exp(-self.r * self.t)
+        raise ValueError("option_type should be 'call' or 'put', got {!r}".format(option_type))
+
+    def diffusion_model(self, simulations, time_steps, option_type, graph='No', chunk_size=None):
+        """
+        Monte Carlo price of a European option. Unless the paths are graphed only the terminal stock price is
+        kept, so memory is O(simulations).
+
+        :param chunk_size: number of paths simulated together, see HestonProcess.diffusion_streaming.
+        """
+        model_inputs = self.process()
 
         if graph == 'Yes':
+            from matplotlib import pyplot as plt
+
+            (s, v) = model_inputs.diffusion(time_steps, simulations)
+            expected_value = s[:, -1]
+
             plt.figure()
-            plt.plot(arange(0, self.t * 365, self.t / time_steps * 365), mean(s, axis=0), label='Stock Price')
+            plt.plot(linspace(0, self.t * 365, time_steps + 1), mean(s, axis=0), label='Stock Price')
             plt.legend()
             plt.ylabel("Stock Price")
             plt.xlabel("Time (Days)")
@@ -49,35 +121,224 @@ class DiffusionHestonModel:
             plt.show()
 
             plt.figure()
-            plt.plot(arange(0, self.t * 365, self.t / time_steps * 365), mean(v, axis=0), label='Volatility')
+            plt.plot(linspace(0, self.t * 365, time_steps + 1), mean(v, axis=0), label='Volatility')
             plt.legend()
             plt.ylabel("Volatility")
             plt.xlabel("Time (Days)")
             plt.title("Heston Volatility Diffusion")
             plt.grid()
             plt.show()
+        else:
+            (expected_value, v) = model_inputs.diffusion_streaming(time_steps, simulations, chunk_size=chunk_size)
 
+        return mean(self.payoff(expected_value, option_type), axis=0)
 
-        expected_value = s[time_steps-1]
-        if option_type == 'call':
-            return mean((maximum(expected_value - self.k, 0)) * exp(-self.r * self.t), axis=0)
-        elif option_type == 'put':
-            return mean((maximum(expected_value - self.k, 0)) * exp(-self.r * self.t), axis=0)
+    def control_variates(self, s_t, option_type, control_variate, control_strike=None):
+        """
+        Controls with an expectation known in closed form.
+
+        :param control_variate: 'stock' for the discounted terminal stock, whose expectation is s, 'european' for
+            a European of option_type struck at control_strike priced by HestonModel, or 'both'.
+        :param control_strike: strike of the European control, 5% above the option's strike if None. It must
+            differ from the option's strike, otherwise the control is the payoff itself and the estimate collapses
+            to the HestonModel price with a meaningless zero standard error.
+        :return: samples of the controls of shape (simulations, n_controls) and their expectations.
+        """
+        control_strike = 1.05 * self.k if control_strike is None else control_strike
+        if control_variate in ('european', 'both') and isclose(control_strike, self.k, rtol=1e-12, atol=0):
+            raise ValueError("the European control must be struck away from the option's strike {}".format(self.k))
+        samples = []
+        expectations = []
+        if control_variate in ('stock', 'both'):
+            samples.append(s_t * exp(-self.r * self.t))
+            expectations.append(self.s)
+        if control_variate in ('european', 'both'):
+            heston = HestonModel(self.s, control_strike, self.t, self.v, self.r, self.theta, self.kappa, self.sigma,
+                                 self.rho)
+            samples.append(self.payoff(s_t, option_type, control_strike))
+            if option_type == 'call':
+                expectations.append(heston.european_call(method='gauss'))
+            elif option_type == 'put':
+                expectations.append(heston.european_put(method='gauss'))
+        return column_stack(samples), array(expectations)
 
+    def diffusion_model_statistics(self, simulations, time_steps, option_type, antithetic=False,
+                                   control_variate=None, control_strike=None, chunk_size=None):
+        """
+        Monte Carlo price of a European option with its standard error, optionally variance reduced.
+
+        With antithetics the paths come in pairs driven by opposite normals and the pair averages are the
+        independent samples. With control variates the price is the regression estimator
+        mean(Y) - beta (mean(X) - E[X]), beta being the least squares coefficient of the payoffs Y on the controls X,
+        and the standard error is that of the regression residuals.
+
+        :param antithetic: simulate antithetic pairs, simulations must be even.
+        :param control_variate: None, 'stock', 'european' or 'both', see control_variates.
+        :param control_strike: strike of the European control, 5% above the option's strike if None.
+        :param chunk_size: number of paths simulated together, see HestonProcess.diffusion_streaming.
+        :return: dict of the price, its standard_error and the variance_reduction factor, the ratio of the plain
+            Monte Carlo variance of the price to the achieved one, i.e. how many times fewer paths are needed for
+            the same standard error. It is inf when the residuals have no variance at all.
+        """
+        (s_t, v_t) = self.process().diffusion_streaming(time_steps, simulations, chunk_size=chunk_size,
+                                                        antithetic=antithetic)
+        payoffs = self.payoff(s_t, option_type)
+        plain_variance = payoffs.var(ddof=1) / simulations
+
+        y = payoffs
+        if control_variate is not None:
+            (x, expectations) = self.control_variates(s_t, option_type, control_variate, control_strike)
+        if antithetic:
+            half = simulations // 2
+            y = 0.5 * (y[:half] + y[half:])
+            if control_variate is not None:
+                x = 0.5 * (x[:half] + x[half:])
+
+        if control_variate is None:
+            price = y.mean()
+            residuals = y - price
+        else:
+            centred_x = x - x.mean(axis=0)
+            beta = lstsq(centred_x, y - y.mean(), rcond=None)[0]
+            price = y.mean() - (x.mean(axis=0) - expectations) @ beta
+            residuals = y - y.mean() - centred_x @ beta
+
+        n = len(y)
+        standard_error = sqrt(residuals @ residuals / (n - 1 - (0 if control_variate is None else x.shape[1])) / n)
+        return {'price': price,
+                'standard_error': standard_error,
+                'variance_reduction': plain_variance / standard_error**2 if standard_error > 0 else inf}
 
+    def randomised_qmc(self, simulations, time_steps, option_type, replications=16, brownian_bridge=True,
+                       chunk_size=None):
+        """
+        Randomised quasi-Monte Carlo price. The option is priced replications times, each time with an
+        independently scrambled Sobol sequence, so the replication prices are independent unbiased estimates
+        whose spread gives the standard error. For smooth payoffs the error decays close to 1 / simulations
+        rather than 1 / sqrt(simulations).
 
+        :param simulations: number of paths per replication, preferably a power of two.
+        :param replications: number of independent scramblings.
+        :param brownian_bridge: build the paths with a Brownian bridge, see SobolGenerator.
+        :param chunk_size: number of paths simulated together, see HestonProcess.diffusion_streaming.
+        :return: dict of the price, its standard_error and the variance_reduction factor against plain Monte
+            Carlo with the same total number of paths.
+        """
+        estimates = []
+        plain_variance = 0
+        for seed in random.SeedSequence(self.seed).spawn(replications):
+            generator = SobolGenerator(seed, brownian_bridge=brownian_bridge)
+            (s_t, v_t) = self.process(generator).diffusion_streaming(time_steps, simulations, chunk_size=chunk_size)
+            payoffs = self.payoff(s_t, option_type)
+            estimates.append(payoffs.mean())
+            plain_variance += payoffs.var(ddof=1) / replications
 
+        estimates = array(estimates)
+        standard_error = estimates.std(ddof=1) / sqrt(replications)
+        return {'price': estimates.mean(),
+                'standard_error': standard_error,
+                'variance_reduction': plain_variance / (simulations * replications) / standard_error**2}
 
-hest = DiffusionHestonModel(s=150,
-                            k=155,
-                            t=15/365,
-                            v=0.0105,
-                            r=0.1,
-                            theta=0.0837,
-                            kappa=74.32,
-                            sigma=3.4532,
-                            rho=-0.8912)
+    def simulate_chunk(self, seed, simulations, time_steps, option_type, antithetic=False):
+        """
+        :param seed: SeedSequence of the chunk's pseudo-random normals.
+        :return: RunningMoments of the chunk's discounted payoffs, pair averaged with antithetics.
+        """
+        (s_t, v_t) = self.process(PseudoRandomGenerator(seed)).diffusion_streaming(time_steps, simulations,
+                                                                                     antithetic=antithetic)
+        payoffs = self.payoff(s_t, option_type)
+        if antithetic:
+            payoffs = 0.5 * (payoffs[:simulations // 2] + payoffs[simulations // 2:])
 
+        moments = RunningMoments()
+        moments.update(payoffs)
+        return moments
 
+    def parallel_diffusion_model(self, simulations, time_steps, option_type, chunk_size=65536, workers=1,
+                                 antithetic=False):
+        """
+        Monte Carlo price with the paths split into chunks run across a process pool. Chunk i always gets the
+        i-th stream spawned from SeedSequence(seed) and the chunk moments are merged in chunk order, so the result
+        is bit for bit the same for any number of workers. The chunks are always pseudo-random, so a model with a
+        generator, e.g. a SobolGenerator whose points cannot be split into independent streams, is rejected.
+
+        :param chunk_size: number of paths per chunk, even with antithetics.
+        :param workers: number of processes, 1 runs the chunks in this process.
+        :param antithetic: simulate antithetic pairs within each chunk.
+        :return: dict of the price and its standard_error.
+        """
+        if self.generator is not None:
+            raise ValueError("parallel_diffusion_model simulates spawned pseudo-random streams, it cannot use the "
+                             "model's {}".format(type(self.generator).__name__))
+        sizes = [min(chunk_size, simulations - start) for start in range(0, simulations, chunk_size)]
+        seeds = random.SeedSequence(self.seed).spawn(len(sizes))
+        arguments = (seeds, sizes, [time_steps] * len(sizes), [option_type] * len(sizes),
+                     [antithetic] * len(sizes))
+
+        moments = RunningMoments()
+        if workers == 1:
+            for chunk in map(self.simulate_chunk, *arguments):
+                moments.merge(chunk)
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                for chunk in pool.map(self.simulate_chunk, *arguments):
+                    moments.merge(chunk)
+
+        return {'price': moments.mean,
+                'standard_error': moments.standard_error()}
+
+    def diffusion_greeks(self, simulations, time_steps, option_type, bump=0.01, chunk_size=None):
+        """
+        Price, delta, gamma, vega (to v0) and rho of a European option from one set of paths.
+
+        - delta and rho are pathwise: s_t is proportional to s and d s_t / d r = t s_t, so with the discounted
+          payoff g, delta = E[g'(s_t) s_t / s] and rho = E[t e^(-rt) k 1(s_t > k)] for a call.
+        - gamma is mixed: the pathwise delta is differentiated with the likelihood ratio score of the first
+          log stock step, gamma = E[g'(s_t) s_t / s (score - 1 / s)]. The score grows like 1 / sqrt(dt) so fewer
+          time steps give a less noisy gamma.
+        - vega bumps v0 up and down and revalues on common random numbers, as the payoff is not differentiable
+          along the variance path for every scheme.
+
+        The base and both bumped runs draw their normals from copies of the generator in its current state, or
+        from the same pseudo-random stream of seed without one, so a SobolGenerator gives quasi-random Greeks.
+
+        :param bump: relative bump of v0 for the vega.
+        :param chunk_size: number of paths simulated together, see HestonProcess.diffusion_streaming.
+        :return: dict of the price and Greeks, with their standard errors under 'standard_error'.
+        """
+        seed = random.SeedSequence(self.seed)
+
+        def common_generator():
+            return PseudoRandomGenerator(seed) if self.generator is None else deepcopy(self.generator)
+
+        (s_t, v_t, score) = self.process(common_generator()).diffusion_streaming(
+            time_steps, simulations, chunk_size=chunk_size, score=True)
+
+        discount = exp(-self.r * self.t)
+        if option_type == 'call':
+            slope = discount * (s_t > self.k)
+            rho = self.t * discount * self.k * (s_t > self.k)
+        elif option_type == 'put':
+            slope = -discount * (s_t < self.k)
+            rho = -self.t * discount * self.k * (s_t < self.k)
+        else:
+            raise ValueError("option_type should be 'call' or 'put', got {!r}".format(option_type))
+        delta = slope * s_t / self.s
+        gamma = delta * (score - 1 / self.s)
 
+        v_bump = bump * self.v
+        bumped = []
+        for v in (self.v + v_bump, self.v - v_bump):
+            model = DiffusionHestonModel(self.s, self.k, self.t, v, self.r, self.theta, self.kappa, self.sigma,
+                                         self.rho, scheme=self.scheme)
+            (s_bump, v_t) = model.process(common_generator()).diffusion_streaming(
+                time_steps, simulations, chunk_size=chunk_size)
+            bumped.append(self.payoff(s_bump, option_type))
+        vega = (bumped[0] - bumped[1]) / (2 * v_bump)
 
+        samples = {'price': self.payoff(s_t, option_type), 'delta': delta, 'gamma': gamma, 'vega': vega,
+                   'rho': rho}
+        greeks = {name: sample.mean() for (name, sample) in samples.items()}
+        greeks['standard_error'] = {name: sample.std(ddof=1) / sqrt(simulations)
+                                    for (name, sample) in samples.items()}
+        return greeks
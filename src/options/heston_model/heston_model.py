@@ -1,5 +1,54 @@
-from numpy import real, exp, sqrt, log, pi, inf
-import scipy.integrate as integrate
+from functools import lru_cache
+from numpy import real, exp, sqrt, log, pi, inf, absolute, asarray, geomspace, newaxis, maximum, minimum, \
+    argmax, arange, cos, sin, where, array, linspace, size, arctan, ceil, log2
+from numpy.fft import fft
+from numpy.polynomial.legendre import leggauss
+from src import instrumentation
+from src.options.heston_model.cache import LRUCache, parameter_key
+
+# Characteristic function node vectors and P1, P2 integrals shared by every HestonModel, see LRUCache.
+# CACHE.enabled = False turns it off and CACHE.statistics() reports its hits and misses.
+CACHE = LRUCache()
+
+
+@lru_cache(maxsize=None)
+def legendre_nodes(n_nodes):
+    """
+    Gauss-Legendre nodes and weights on [-1, 1]. They only depend on the number of nodes so they are computed once
+    and reused by every fixed-node integration.
+    """
+    return leggauss(n_nodes)
+
+
+def quad(func, a, b, **kwargs):
+    """
+    scipy.integrate.quad, imported on first use. Only the adaptive methods need it and scipy.integrate takes
+    several times longer to import than numpy, which is all the fixed-node methods use.
+
+    With instrumentation enabled, quad is run with full_output to record its integrand evaluations, subintervals,
+    error estimate and latency, and a quad.warning event is recorded with the parameters of the model the
+    integrand belongs to when scipy reports a problem. The integral and its error are returned either way.
+    """
+    from scipy.integrate import quad as scipy_quad
+    if not instrumentation.enabled:
+        return scipy_quad(func, a, b, **kwargs)
+
+    kwargs['full_output'] = 1
+    with instrumentation.timer('quad') as timer:
+        result = scipy_quad(func, a, b, **kwargs)
+    (integral, error, information) = result[:3]
+    registry = instrumentation.REGISTRY
+    registry.count('quad.calls')
+    registry.observe('quad.evaluations', information['neval'])
+    registry.observe('quad.subintervals', information.get('last', 0))
+    registry.observe('quad.error', error)
+    if len(result) > 3:
+        model = getattr(func, '__self__', None)
+        registry.event('quad.warning', integrand=getattr(func, '__name__', repr(func)), message=result[3],
+                       integral=integral, error=error, subintervals=information.get('last', 0),
+                       seconds=timer.seconds, parameters=dict(vars(model)) if model is not None else None)
+    return integral, error
+
 
 class HestonModel:
 
@@ -25,6 +74,12 @@ class HestonModel:
         self.sigma = sigma
         self.rho = rho
 
+    def cache_key(self, *extra):
+        """
+        :return: key of everything the characteristic function depends on, followed by the extra values.
+        """
+        return parameter_key(self.s, self.t, self.v, self.r, self.theta, self.kappa, self.sigma, self.rho, *extra)
+
     def characteristic_function(self, phi, j):
         """
         - The characteristic function is the Fourier transform of the probability density function (PDF)
@@ -38,6 +93,10 @@ class HestonModel:
         :param j: either 1 or 2, so it runs through both probability functions P1 and P2.
         :return: The characteristic function of the log of the stock price.
         """
+        if instrumentation.enabled:
+            instrumentation.REGISTRY.count('heston.cf_calls')
+            instrumentation.REGISTRY.count('heston.cf_points', size(phi))
+
         if j == 1:
             u = 0.5
             b = self.kappa - self.rho * self.sigma
@@ -88,8 +147,51 @@ class HestonModel:
         f = exp(C + D * self.v + complex(0, 1) * phi * x)
         return a, b, d, g, C,  D, f
 
-    def integrand(self, phi, j):
-        (a, b, d, g, C,  D, f) = self.characteristic_function(phi, j)
+    def characteristic_function_gradient(self, phi, j, cf=None):
+        """
+        Derivatives of ln(f_j) with respect to the model parameters, from differentiating the Lord & Kahl form of
+        C and D above. Every parameter enters through b - rho * sigma * phi * i, sigma and a = kappa * theta, so
+        each derivative is the chain rule through d, g and exp(-d * t).
+
+        :param phi: points to evaluate at.
+        :param j: either 1 or 2.
+        :param cf: the characteristic_function(phi, j) tuple if it has already been evaluated.
+        :return: d ln(f_j) / d(v, theta, kappa, sigma, rho).
+        """
+        (a, b, d, g, C, D, f) = self.characteristic_function(phi, j) if cf is None else cf
+        u = 0.5 if j == 1 else -0.5
+        beta = b - self.rho * self.sigma * phi * complex(0, 1)
+        q = 2 * u * phi * complex(0, 1) - phi**2
+        e_dt = exp(-d * self.t)
+        log_ratio = (beta - d) * self.t - 2 * log((1 - g * e_dt) / (1 - g))
+        ratio = (1 - e_dt) / (1 - g * e_dt)
+
+        def derivative(d_beta, d_sigma, d_a):
+            d_d = (beta * d_beta - self.sigma * q * d_sigma) / d
+            d_g = 2 * (d * d_beta - beta * d_d) / (beta + d)**2
+            d_e_dt = -self.t * e_dt * d_d
+            d_log_ratio = (d_beta - d_d) * self.t - \
+                2 * (d_g / (1 - g) - (d_g * e_dt + g * d_e_dt) / (1 - g * e_dt))
+            d_ratio = (-d_e_dt * (1 - g * e_dt) + (1 - e_dt) * (d_g * e_dt + g * d_e_dt)) / (1 - g * e_dt)**2
+
+            d_C = (d_a / self.sigma**2 - 2 * a * d_sigma / self.sigma**3) * log_ratio + \
+                a / self.sigma**2 * d_log_ratio
+            d_D = ((d_beta - d_d) / self.sigma**2 - 2 * (beta - d) * d_sigma / self.sigma**3) * ratio + \
+                (beta - d) / self.sigma**2 * d_ratio
+            return d_C + self.v * d_D
+
+        # b = kappa - rho * sigma for j=1 and b = kappa for j=2.
+        (d_b_d_sigma, d_b_d_rho) = (-self.rho, -self.sigma) if j == 1 else (0, 0)
+        return (
+            D,
+            self.kappa / self.sigma**2 * log_ratio,
+            derivative(1, 0, self.theta),
+            derivative(d_b_d_sigma - self.rho * phi * complex(0, 1), 1, 0),
+            derivative(d_b_d_rho - self.sigma * phi * complex(0, 1), 0, 0),
+        )
+
+    def integrand(self, phi, j, cf=None):
+        (a, b, d, g, C,  D, f) = self.characteristic_function(phi, j) if cf is None else cf
 
         return real(
             exp(-phi * complex(0, 1) * log(self.k)) * f /
@@ -104,17 +206,343 @@ class HestonModel:
             - P1 = The options delta
             - P2 = The risk neutral probability of exercise.
         """
-        integrated = integrate.quad(self.integrand, 0, inf, args=j, epsabs=0, full_output=0)
-        # integrate.quad(self.integrand, lower limit, upper limit, args= extra arguments to pass through function )
-        return 0.5 + (1 / pi) * integrated[0]
+        def integrate():
+            integrated = quad(self.integrand, 0, inf, args=j, epsabs=0, full_output=0)
+            # quad(self.integrand, lower limit, upper limit, args= extra arguments to pass through function )
+            return 0.5 + (1 / pi) * integrated[0]
+
+        return CACHE.get_or_compute(('quad', j) + self.cache_key(self.k), integrate)
+
+    def integration_limit(self, tolerance=1e-10, phi_max=1e4):
+        """
+        Upper limit for the fixed-node integration. The integrand of P_j is bounded by |f_j| / phi, so the
+        [0, inf) integral is truncated where that envelope of both characteristic functions drops below tolerance.
+
+        :param tolerance: size of the integrand envelope that is treated as zero.
+        :param phi_max: largest limit that will be returned.
+        :return: the truncation point of the phi integral, one per parameter set if the parameters are arrays
+            of shape (S, 1).
+        """
+        phi = geomspace(1e-2, phi_max, 64)
+        envelope = maximum(absolute(self.characteristic_function(phi, 1)[6]),
+                           absolute(self.characteristic_function(phi, 2)[6])) / phi
+        above_tolerance = envelope > tolerance
+        # Position just after the last point that is above tolerance.
+        after_last = len(phi) - argmax(above_tolerance[..., ::-1], axis=-1)
+        return where(above_tolerance.any(axis=-1), phi[minimum(after_last, len(phi) - 1)], phi[0])
+
+    def quadrature_rule(self, n_nodes=128, tolerance=1e-10):
+        """
+        Gauss-Legendre rule on [0, integration_limit].
+
+        :return: phi nodes and their weights, of shape (n_nodes,) or (S, n_nodes) for S parameter sets.
+        """
+        (x, w) = legendre_nodes(n_nodes)
+        limit = asarray(self.integration_limit(tolerance))[..., newaxis]
+        return 0.5 * limit * (x + 1), 0.5 * limit * w
+
+    def characteristic_function_nodes(self, n_nodes=128, tolerance=1e-10):
+        """
+        The quadrature_rule and both characteristic functions on its nodes, from the cache when a model with the
+        same parameters has already evaluated them. They do not depend on the strike.
+
+        :return: phi, weights, and the characteristic_function tuples for j=1 and j=2, with read-only arrays.
+        """
+        def evaluate():
+            (phi, weights) = self.quadrature_rule(n_nodes, tolerance)
+            return phi, weights, self.characteristic_function(phi, 1), self.characteristic_function(phi, 2)
+
+        return CACHE.get_or_compute(('nodes',) + self.cache_key(n_nodes, tolerance), evaluate)
+
+    def probability_functions_gauss(self, n_nodes=128, tolerance=1e-10):
+        """
+        P1 and P2 from a precomputed quadrature rule rather than an adaptive quad. The characteristic function is
+        evaluated once for j=1 and once for j=2 on the whole vector of phi nodes, and the strike, which can be an
+        array, only enters through the exp(-i * phi * ln(K)) factor.
+
+        v, theta, kappa, sigma and rho can also be arrays of shape (S, 1), one parameter set per row, to price a
+        whole population of parameter sets in one evaluation.
+
+        :param n_nodes: number of Gauss-Legendre nodes.
+        :param tolerance: integrand envelope used to pick the truncation point, see integration_limit.
+        :return: P1 and P2, with the shape of the strike, or (S,) + shape of the strike.
+        """
+        def integrate():
+            (phi, weights, cf_1, cf_2) = self.characteristic_function_nodes(n_nodes, tolerance)
+            (f_1, f_2) = (cf_1[6], cf_2[6])
+
+            k = asarray(self.k, dtype=float)
+            if phi.ndim > 1 and k.ndim > 0:
+                # One rule per parameter set, (S, n_nodes) against the strikes gives (S, strikes, n_nodes).
+                (phi, weights, f_1, f_2) = (x[..., newaxis, :] for x in (phi, weights, f_1, f_2))
+            strike_factor = exp(-phi * complex(0, 1) * log(k)[..., newaxis]) / (phi * complex(0, 1)) * weights
+
+            p_1 = 0.5 + (1 / pi) * real((strike_factor * f_1).sum(axis=-1))
+            p_2 = 0.5 + (1 / pi) * real((strike_factor * f_2).sum(axis=-1))
+            return p_1, p_2
 
-    def european_call(self):
-        return self.s * self.probability_function(1) - self.k * exp(-self.r * self.t) * self.probability_function(2)
+        return CACHE.get_or_compute(('gauss',) + self.cache_key(self.k, n_nodes, tolerance), integrate)
 
-    def european_put(self):
-        put_price = self.k * exp(-self.r*self.t) * (1-self.probability_function(2)) \
-                    - self.s * (1-self.probability_function(1))
-        return put_price
+    def european_call_gradient(self, n_nodes=128, tolerance=1e-10):
+        """
+        Analytic derivatives of the call price with respect to (v, theta, kappa, sigma, rho), on the same
+        Gauss-Legendre rule as probability_functions_gauss. d P_j / d param is the P_j integral with f_j replaced
+        by f_j * d ln(f_j) / d param.
+
+        :return: array of shape (5,) + shape of the strike.
+        """
+        (phi, weights, cf_1, cf_2) = self.characteristic_function_nodes(n_nodes, tolerance)
+        strike_factor = exp(-phi * complex(0, 1) * log(asarray(self.k, dtype=float))[..., newaxis]) / \
+            (phi * complex(0, 1)) * weights
+
+        d_p = []
+        for (j, cf) in ((1, cf_1), (2, cf_2)):
+            d_p.append(array([(1 / pi) * real(strike_factor @ (cf[6] * d_log_f))
+                              for d_log_f in self.characteristic_function_gradient(phi, j, cf)]))
+        return self.s * d_p[0] - self.k * exp(-self.r * self.t) * d_p[1]
+
+    def european_call(self, method='quad'):
+        """
+        :param method: 'quad' for the adaptive integration, 'gauss' for the fixed-node quadrature.
+        """
+        with instrumentation.timer('heston.european_call'):
+            if method == 'gauss':
+                (p_1, p_2) = self.probability_functions_gauss()
+                return self.s * p_1 - self.k * exp(-self.r * self.t) * p_2
+            return self.s * self.probability_function(1) - \
+                self.k * exp(-self.r * self.t) * self.probability_function(2)
+
+    def european_put(self, method='quad'):
+        """
+        :param method: 'quad' for the adaptive integration, 'gauss' for the fixed-node quadrature.
+        """
+        with instrumentation.timer('heston.european_put'):
+            if method == 'gauss':
+                (p_1, p_2) = self.probability_functions_gauss()
+                return self.k * exp(-self.r * self.t) * (1 - p_2) - self.s * (1 - p_1)
+            put_price = self.k * exp(-self.r*self.t) * (1-self.probability_function(2)) \
+                        - self.s * (1-self.probability_function(1))
+            return put_price
+
+    def moment_explosion_time(self, omega):
+        """
+        Time at which E[S_T^omega] becomes infinite, Andersen & Piterbarg (2007) proposition 3.1, for omega > 1.
+        Link: https://papers.ssrn.com/sol3/papers.cfm?abstract_id=559481
+
+        The moment solves a Riccati equation whose coefficient k = rho * sigma * omega - kappa and discriminant
+        D = k^2 - sigma^2 * (omega^2 - omega) decide whether, and when, it blows up.
+
+        :return: the explosion time in years, inf if the moment is finite at every maturity.
+        """
+        k = self.rho * self.sigma * omega - self.kappa
+        discriminant = k**2 - self.sigma**2 * (omega**2 - omega)
+        if discriminant >= 0:
+            if k < 0:
+                return inf
+            return log((k + sqrt(discriminant)) / (k - sqrt(discriminant))) / sqrt(discriminant)
+        if k == 0:
+            return pi / sqrt(-discriminant)
+        return 2 / sqrt(-discriminant) * (pi * (k < 0) + arctan(sqrt(-discriminant) / k))
+
+    def critical_moment(self, omega_max=64, iterations=60):
+        """
+        :return: the largest omega, up to omega_max, for which E[S_T^omega] is finite at this maturity, found by
+            bisection on the moment_explosion_time, which decreases with omega.
+        """
+        (lower, upper) = (1.0, 2.0)
+        while self.moment_explosion_time(upper) > self.t:
+            if upper >= omega_max:
+                return omega_max
+            (lower, upper) = (upper, 2 * upper)
+        for i in range(iterations):
+            middle = 0.5 * (lower + upper)
+            if self.moment_explosion_time(middle) > self.t:
+                lower = middle
+            else:
+                upper = middle
+        return lower
+
+    def fft_grid(self, alpha=None, n_points=None, eta=None):
+        """
+        Damping factor and phi grid of european_call_fft.
+
+        The damped transform needs E[S_T^(alpha + 1)] to be finite, otherwise the characteristic function at
+        v - (alpha + 1) * i is evaluated past its singularity and the prices come back wrong without any error.
+        This happens at long maturities and with positive rho, so alpha defaults to half the distance to the
+        critical moment, capped at 1.5. A small alpha makes the transform peak within about alpha of v=0, so eta
+        defaults to alpha / 8 and n_points to keep the log-strike spacing 2 * pi / (n_points * eta) below
+        2 * pi / 1024.
+
+        :return: alpha, n_points and eta.
+        """
+        critical_alpha = self.critical_moment() - 1
+        if alpha is None:
+            alpha = min(1.5, 0.5 * critical_alpha)
+        elif alpha >= critical_alpha:
+            raise ValueError("alpha {:.4g} needs E[S_T^{:.4g}], which is infinite at this maturity, use alpha below "
+                             "{:.4g}".format(alpha, alpha + 1, critical_alpha))
+        if eta is None:
+            eta = min(0.25, alpha / 8)
+        if n_points is None:
+            n_points = int(2 ** max(12, ceil(log2(1024 / eta))))
+        return alpha, n_points, eta
+
+    def european_call_fft(self, strikes=None, alpha=None, n_points=None, eta=None):
+        """
+        Carr-Madan FFT pricing of calls on a whole log-strike grid for this maturity.
+        Link: https://engineering.nyu.edu/sites/default/files/2018-08/CarrMadan2_0.pdf
+
+        The characteristic function does not depend on the strike, so it is evaluated once on the grid
+        v_j = eta * j and a single FFT returns the damped call transform at the log-strikes
+        ln(S) + lambda * (u - N / 2), where lambda = 2 * pi / (N * eta). Simpson weights are used on the phi grid.
+
+        :param strikes: strikes to return prices for. If None the whole strike grid and its prices are returned.
+        :param alpha: damping factor, the call is multiplied by exp(alpha * k) to make it square integrable.
+            Picked below the moment explosion bound if None, see fft_grid, which raises for a larger one.
+        :param n_points: number of FFT points, a power of 2, see fft_grid if None.
+        :param eta: spacing of the phi grid, see fft_grid if None.
+        :return: call prices at the given strikes, interpolated with a cubic spline in log-strike, or
+            (strike grid, call prices) when no strikes are given.
+        """
+        (alpha, n_points, eta) = self.fft_grid(alpha, n_points, eta)
+        v = eta * arange(n_points)
+        log_strike_spacing = 2 * pi / (n_points * eta)
+        log_strike_grid = log(self.s) + log_strike_spacing * (arange(n_points) - n_points / 2)
+
+        # f_2 is the risk neutral characteristic function of ln(S_T), here evaluated at a complex argument.
+        f_2 = self.characteristic_function(v - (alpha + 1) * complex(0, 1), 2)[6]
+        psi = exp(-self.r * self.t) * f_2 / (alpha**2 + alpha - v**2 + complex(0, 1) * (2 * alpha + 1) * v)
+
+        simpson = (3 + (-1) ** arange(1, n_points + 1)) / 3
+        simpson[0] = 1 / 3
+        transform = fft(exp(-complex(0, 1) * v * log_strike_grid[0]) * psi * eta * simpson)
+
+        call_prices = exp(-alpha * log_strike_grid) / pi * real(transform)
+        if strikes is None:
+            return exp(log_strike_grid), call_prices
+
+        from scipy.interpolate import CubicSpline
+        return CubicSpline(log_strike_grid, call_prices)(log(asarray(strikes, dtype=float)))
+
+    def european_put_fft(self, strikes=None, alpha=None, n_points=None, eta=None):
+        """
+        Puts from european_call_fft through put-call parity.
+        """
+        if strikes is None:
+            (strike_grid, call_prices) = self.european_call_fft(None, alpha, n_points, eta)
+            return strike_grid, call_prices - self.s + strike_grid * exp(-self.r * self.t)
+        call_prices = self.european_call_fft(strikes, alpha, n_points, eta)
+        return call_prices - self.s + asarray(strikes, dtype=float) * exp(-self.r * self.t)
+
+    def cumulants(self):
+        """
+        First and second cumulants of ln(S_T / S), used for the COS truncation range.
+
+        ln(S_T / S) = r * t - I / 2 + M, where I is the integrated variance and M = int sqrt(v) dW_s, so
+        c_2 = Var(I) / 4 + E[I] - rho * Cov(I, int sqrt(v) dW_v). The c_2 printed in Fang & Oosterlee (2008)
+        table 11 contains a typo, these are the moments worked out directly.
+        """
+        e_kt = exp(-self.kappa * self.t)
+        mean_integrated_variance = self.theta * self.t + (self.v - self.theta) * (1 - e_kt) / self.kappa
+        variance_integrated_variance = self.sigma**2 / self.kappa**3 * (
+            self.kappa * self.t * self.theta + 2 * self.kappa * self.t * (self.theta - self.v) * e_kt +
+            2 * self.theta * e_kt + 0.5 * self.theta * e_kt**2 - 2.5 * self.theta + self.v * (1 - e_kt**2)
+        )
+        covariance = self.sigma * (
+            self.theta * (self.t / self.kappa - (1 - e_kt) / self.kappa**2) +
+            (self.v - self.theta) * (1 - e_kt * (1 + self.kappa * self.t)) / self.kappa**2
+        )
+
+        c_1 = self.r * self.t - 0.5 * mean_integrated_variance
+        c_2 = 0.25 * variance_integrated_variance + mean_integrated_variance - self.rho * covariance
+        return c_1, c_2
+
+    def cos_terms(self, width, tolerance, max_terms):
+        """
+        Number of COS terms for a range of the given width: the smallest power of 2 at which the terms that are
+        dropped have decayed below tolerance. A term is the characteristic function at u_k = k * pi / width times
+        a payoff coefficient of order 2 / (width * u_k).
+        """
+        n_terms = 16
+        while n_terms < max_terms and \
+                absolute(self.characteristic_function(n_terms * pi / width, 2)[6]) * 2 / (n_terms * pi) > tolerance:
+            n_terms *= 2
+        return n_terms
+
+    def cos_truncation_range(self, tolerance=1e-8, truncation=12, max_truncation=96, max_terms=4096):
+        """
+        Range [c_1 - L * sqrt(c_2), c_1 + L * sqrt(c_2)] of ln(S_T / S) used by the COS method.
+
+        Heston densities have exponential rather than Gaussian tails, so a fixed L is not enough for short dated,
+        high vol of vol parameter sets. L starts at truncation and is widened by half until the recovered density
+        at both ends of the range, scaled by the standard deviation, is below tolerance. That product is the order
+        of the probability mass left outside the range.
+
+        :return: lower and upper end of the range.
+        """
+        (c_1, c_2) = self.cumulants()
+        spread = sqrt(absolute(c_2))
+        initial_truncation = truncation
+        while True:
+            (lower, upper) = (c_1 - truncation * spread, c_1 + truncation * spread)
+            n_terms = self.cos_terms(upper - lower, tolerance, max_terms)
+            if n_terms >= max_terms and truncation > initial_truncation:
+                # A wider range would no longer be resolved by max_terms, so keep the previous one.
+                return c_1 - truncation / 1.5 * spread, c_1 + truncation / 1.5 * spread
+            u = arange(n_terms) * pi / (upper - lower)
+            terms = real(self.characteristic_function(u, 2)[6] * exp(-complex(0, 1) * u * (log(self.s) + lower)))
+            terms[0] = 0.5 * terms[0]
+            density_lower = 2 / (upper - lower) * terms.sum()
+            density_upper = 2 / (upper - lower) * (terms * (-1) ** arange(n_terms)).sum()
+
+            if max(absolute(density_lower), absolute(density_upper)) * spread < tolerance or \
+                    truncation >= max_truncation:
+                return lower, upper
+            truncation = 1.5 * truncation
+
+    def european_put_cos(self, strikes=None, tolerance=1e-8, truncation=12, max_terms=4096):
+        """
+        Fourier-cosine (COS) expansion pricing of puts, Fang & Oosterlee (2008).
+        Link: https://mpra.ub.uni-muenchen.de/8914/4/MPRA_paper_8914.pdf
+
+        The density of y = ln(S_T / K) is expanded in cosines on [a, b], the range from cos_truncation_range
+        shifted by every strike's log-moneyness. The put payoff coefficients have a closed form on [a, 0], so the
+        price of every strike is one dot product with the characteristic function values. Both the range and the
+        number of terms are picked from the tolerance, which is relative to the strike.
+
+        :param strikes: strikes to price, self.k if None.
+        :param tolerance: accuracy target relative to the strike.
+        :param truncation: initial number of standard deviations in the integration range.
+        :param max_terms: largest number of cosine terms.
+        :return: put prices with the shape of the strikes.
+        """
+        k = asarray(self.k if strikes is None else strikes, dtype=float)
+        x = log(self.s / k)
+        (lower, upper) = self.cos_truncation_range(tolerance, truncation, max_terms=max_terms)
+        a = x.min() + lower
+        b = x.max() + upper
+
+        u = arange(self.cos_terms(b - a, tolerance, max_terms)) * pi / (b - a)
+        # Characteristic function of ln(S_T / S), f_2 without the exp(i * phi * ln(S)) spot term.
+        cf = self.characteristic_function(u, 2)[6] * exp(-complex(0, 1) * u * log(self.s))
+
+        # chi and psi are the cosine integrals of e^y and 1 over [a, d], the part of the range where the put pays
+        # K * (1 - e^y). d is 0 unless the whole range lies on one side of the strike.
+        d = min(max(a, 0), b)
+        chi = (cos(u * (d - a)) * exp(d) - exp(a) + u * sin(u * (d - a)) * exp(d)) / (1 + u**2)
+        psi = where(u == 0, d - a, sin(u * (d - a)) / where(u == 0, 1, u))
+        payoff = 2 / (b - a) * (psi - chi)
+        payoff[0] = 0.5 * payoff[0]
+
+        expansion = real(exp(complex(0, 1) * (x - a)[..., newaxis] * u) @ (cf * payoff))
+        return k * exp(-self.r * self.t) * expansion
+
+    def european_call_cos(self, strikes=None, tolerance=1e-8, truncation=12, max_terms=4096):
+        """
+        Calls from european_put_cos through put-call parity, which is more stable than expanding the call payoff.
+        """
+        k = asarray(self.k if strikes is None else strikes, dtype=float)
+        return self.european_put_cos(k, tolerance, truncation, max_terms) + self.s - k * exp(-self.r * self.t)
 
     def prob_of_exercise(self):
         """
@@ -132,12 +560,12 @@ class HestonModel:
         if option_type == 'call':
             return self.probability_function(1)
         elif option_type == 'put':
-            return - self.probability_function(1)
+            return self.probability_function(1) - 1
 
-    def greek_integrand_gamma(self, phi):
+    def greek_integrand_gamma(self, phi, cf_1=None, cf_2=None):
 
-        (a, b, d, g, C, D, f_1) = self.characteristic_function(phi, 1)
-        (a, b, d, g, C, D, f_2) = self.characteristic_function(phi, 2)
+        (a, b, d, g, C, D, f_1) = self.characteristic_function(phi, 1) if cf_1 is None else cf_1
+        (a, b, d, g, C, D, f_2) = self.characteristic_function(phi, 2) if cf_2 is None else cf_2
 
         return real(
             exp(complex(0, -1) * phi * log(self.k)) *
@@ -149,12 +577,12 @@ class HestonModel:
 
     def greek_gamma(self, option_type):
         if option_type == 'call' or 'put':
-            return 1/pi * integrate.quad(self.greek_integrand_gamma, 0, inf)[0]
+            return 1/pi * quad(self.greek_integrand_gamma, 0, inf)[0]
 
-    def greek_integrand_vega(self, phi):
+    def greek_integrand_vega(self, phi, cf_1=None, cf_2=None):
 
-        (a, b_1, d_1, g_1, C_1, D_1, f_1) = self.characteristic_function(phi, 1)
-        (a, b_2, d_2, g_2, C_2, D_2, f_2) = self.characteristic_function(phi, 2)
+        (a, b_1, d_1, g_1, C_1, D_1, f_1) = self.characteristic_function(phi, 1) if cf_1 is None else cf_1
+        (a, b_2, d_2, g_2, C_2, D_2, f_2) = self.characteristic_function(phi, 2) if cf_2 is None else cf_2
 
         # Doing some algebra to get into one statement. Bring in S and K, then exp( phi * i * ln(K)) is common.
         integrand_vega = real(
@@ -171,12 +599,12 @@ class HestonModel:
 
     def greek_vega(self, option_type):
         if option_type == 'call' or 'put':
-            return (1/pi) * integrate.quad(self.greek_integrand_vega, 0, inf)[0]
+            return (1/pi) * quad(self.greek_integrand_vega, 0, inf)[0]
 
-    def greek_integrand_rho(self, phi):
+    def greek_integrand_rho(self, phi, cf_1=None, cf_2=None):
 
-        (a, b_1, d_1, g_1, C_1, D_1, f_1) = self.characteristic_function(phi, 1)
-        (a, b_2, d_2, g_2, C_2, D_2, f_2) = self.characteristic_function(phi, 2)
+        (a, b_1, d_1, g_1, C_1, D_1, f_1) = self.characteristic_function(phi, 1) if cf_1 is None else cf_1
+        (a, b_2, d_2, g_2, C_2, D_2, f_2) = self.characteristic_function(phi, 2) if cf_2 is None else cf_2
 
         integrand_rho = real(
             exp(-complex(0, 1) * phi * log(self.k)) *
@@ -191,15 +619,15 @@ class HestonModel:
         if option_type == 'call':
             return (0.5 * self.k * self.t) \
                    * exp(-self.r * self.t) + \
-                   (self.t/pi) * integrate.quad(self.greek_integrand_rho, 0, inf)[0]
+                   (self.t/pi) * quad(self.greek_integrand_rho, 0, inf)[0]
         elif option_type == 'put':
             return -(0.5 * self.k * self.t) \
                    * exp(-self.r * self.t) + \
-                   (self.t / pi) * integrate.quad(self.greek_integrand_rho, 0, inf)[0]
+                   (self.t / pi) * quad(self.greek_integrand_rho, 0, inf)[0]
 
-    def greek_volga_integrand(self, phi):
-        (a, b_1, d_1, g_1, C_1, D_1, f_1) = self.characteristic_function(phi, 1)
-        (a, b_2, d_2, g_2, C_2, D_2, f_2) = self.characteristic_function(phi, 2)
+    def greek_volga_integrand(self, phi, cf_1=None, cf_2=None):
+        (a, b_1, d_1, g_1, C_1, D_1, f_1) = self.characteristic_function(phi, 1) if cf_1 is None else cf_1
+        (a, b_2, d_2, g_2, C_2, D_2, f_2) = self.characteristic_function(phi, 2) if cf_2 is None else cf_2
 
         integrand_volga = real(
             exp(-complex(0, 1) * phi * log(self.k)) /
@@ -211,11 +639,11 @@ class HestonModel:
 
     def greek_volga(self, option_type):
         if option_type == 'call' or 'put':
-            return 1/pi * integrate.quad(self.greek_volga_integrand, 0, inf)[0]
+            return 1/pi * quad(self.greek_volga_integrand, 0, inf)[0]
 
-    def greek_vanna_integrand(self, phi):
-        (a, b_1, d_1, g_1, C_1, D_1, f_1) = self.characteristic_function(phi, 1)
-        (a, b_2, d_2, g_2, C_2, D_2, f_2) = self.characteristic_function(phi, 2)
+    def greek_vanna_integrand(self, phi, cf_1=None, cf_2=None):
+        (a, b_1, d_1, g_1, C_1, D_1, f_1) = self.characteristic_function(phi, 1) if cf_1 is None else cf_1
+        (a, b_2, d_2, g_2, C_2, D_2, f_2) = self.characteristic_function(phi, 2) if cf_2 is None else cf_2
 
         vanna_integrand = real(
             exp(-complex(0, 1) * phi * log(self.k)) *
@@ -229,7 +657,7 @@ class HestonModel:
 
     def greek_vanna(self, option_type):
         if option_type == 'call' or 'put':
-            return 1/pi * integrate.quad(self.greek_vanna_integrand, 0, inf)[0]
+            return 1/pi * quad(self.greek_vanna_integrand, 0, inf)[0]
 
     def dC_dt(self, phi, a, b, d, g):
 
@@ -251,10 +679,10 @@ class HestonModel:
                        ((1 - g * exp(-d * self.t))**2)
                )
 
-    def theta_integrand(self, phi):
+    def theta_integrand(self, phi, cf_1=None, cf_2=None):
 
-        (a_1, b_1, d_1, g_1, C_1, D_1, f_1) = self.characteristic_function(phi, 1)
-        (a_2, b_2, d_2, g_2, C_2, D_2, f_2) = self.characteristic_function(phi, 2)
+        (a_1, b_1, d_1, g_1, C_1, D_1, f_1) = self.characteristic_function(phi, 1) if cf_1 is None else cf_1
+        (a_2, b_2, d_2, g_2, C_2, D_2, f_2) = self.characteristic_function(phi, 2) if cf_2 is None else cf_2
 
         dC_dt_1 = self.dC_dt(phi, a_1, b_1, d_1, g_1)
         dC_dt_2 = self.dC_dt(phi, a_2, b_2, d_2, g_2)
@@ -278,31 +706,139 @@ class HestonModel:
         if option_type == 'call':
             return -(
                     self.k * self.r * exp(- self.r * self.t) / 2 +
-                    (1/pi) * integrate.quad(self.theta_integrand, 0, inf)[0]
+                    (1/pi) * quad(self.theta_integrand, 0, inf)[0]
             )
         elif option_type == 'put':
             return (
-                    self.k * self.r * exp(- self.r * self.t) / 2 +
-                    (1 / pi) * integrate.quad(self.theta_integrand, 0, inf)[0]
+                    self.k * self.r * exp(- self.r * self.t) / 2 -
+                    (1 / pi) * quad(self.theta_integrand, 0, inf)[0]
             )
 
+    def greeks_all(self, option_type, n_nodes=128, tolerance=1e-10):
+        """
+        Price and every Greek from a single pass over a shared Gauss-Legendre phi grid. The characteristic
+        function, and with it f_j and D_j, is evaluated once for j=1 and once for j=2, and each Greek is a
+        weighted sum of its integrand over those values instead of its own adaptive quad.
+
+        Every parameter can also be an array of shape (S, 1), one point per row, in which case each point gets its
+        own phi grid and every Greek has shape (S, 1).
+
+        :param option_type: either 'call' or 'put'.
+        :param n_nodes: number of Gauss-Legendre nodes.
+        :param tolerance: integrand envelope used to pick the truncation point, see integration_limit.
+        :return: dictionary with price, delta, gamma, vega, rho, volga, vanna and theta.
+        """
+        with instrumentation.timer('heston.greeks_all'):
+            (phi, weights, cf_1, cf_2) = self.characteristic_function_nodes(n_nodes, tolerance)
+
+            def integral(integrand):
+                return (weights * integrand).sum(axis=-1, keepdims=phi.ndim > 1)
+
+            p_1 = 0.5 + (1 / pi) * integral(self.integrand(phi, 1, cf_1))
+            p_2 = 0.5 + (1 / pi) * integral(self.integrand(phi, 2, cf_2))
+            discounted_k = self.k * exp(-self.r * self.t)
+
+            greeks = {
+                'price': self.s * p_1 - discounted_k * p_2,
+                'delta': p_1,
+                'gamma': (1 / pi) * integral(self.greek_integrand_gamma(phi, cf_1, cf_2)),
+                'vega': (1 / pi) * integral(self.greek_integrand_vega(phi, cf_1, cf_2)),
+                'rho': 0.5 * self.t * discounted_k +
+                       (self.t / pi) * integral(self.greek_integrand_rho(phi, cf_1, cf_2)),
+                'volga': (1 / pi) * integral(self.greek_volga_integrand(phi, cf_1, cf_2)),
+                'vanna': (1 / pi) * integral(self.greek_vanna_integrand(phi, cf_1, cf_2)),
+                'theta': -(self.r * discounted_k / 2 + (1 / pi) * integral(self.theta_integrand(phi, cf_1, cf_2))),
+            }
+
+            if option_type == 'put':
+                # Put-call parity, P = C - S + K * exp(-r * t); gamma, vega, volga and vanna are unchanged.
+                greeks['price'] = greeks['price'] - self.s + discounted_k
+                greeks['delta'] = greeks['delta'] - 1
+                greeks['rho'] = greeks['rho'] - self.t * discounted_k
+                greeks['theta'] = greeks['theta'] + self.r * discounted_k
+            return greeks
+
+
+class PreparedHestonOption:
+
+    def __init__(self, model, n_nodes=128, tolerance=1e-10):
+        """
+        A HestonModel with everything that does not depend on the spot evaluated once, for repricing on spot
+        ticks and spot ladders.
+
+        In f_j = exp(C_j + D_j * v + i * phi * ln(s)) only the last factor depends on the spot, and the
+        integrand's strike factor exp(-i * phi * ln(K)) / (i * phi) does not depend on it either. The phi nodes,
+        exp(C_j + D_j * v) and the strike factors, with the quadrature weights folded in, are kept, so a new spot
+        costs exp(i * phi * ln(s)) on the nodes and one matrix product with the strike factors. The nodes come
+        from the model's integration_limit, which does not depend on the spot since |exp(i * phi * ln(s))| = 1.
+
+        :param model: HestonModel, k can be an array of strikes.
+        :param n_nodes: number of Gauss-Legendre nodes.
+        :param tolerance: integrand envelope used to pick the truncation point, see integration_limit.
+        """
+        self.model = model
+        (self.phi, weights, cf_1, cf_2) = model.characteristic_function_nodes(n_nodes, tolerance)
+        self.k = asarray(model.k, dtype=float)
+        self.discounted_k = self.k * exp(-model.r * model.t)
+
+        # exp(C_j + D_j * v) on the nodes, f_j without its spot factor.
+        self.spot_free_cf = [exp(C + D * model.v) for (a, b, d, g, C, D, f) in (cf_1, cf_2)]
+
+        # (nodes, strikes): exp(-i * phi * ln(K)) * weights for gamma, and divided by i * phi for P_j.
+        self.strike_weights = exp(-self.phi[:, newaxis] * complex(0, 1) * log(self.k).reshape(1, -1)) * \
+            weights[:, newaxis]
+        self.strike_factor = self.strike_weights / (self.phi * complex(0, 1))[:, newaxis]
+
+    def spot_factor(self, s):
+        """
+        :return: exp(i * phi * ln(s)) of shape (spots, nodes).
+        """
+        return exp(complex(0, 1) * self.phi * log(asarray(s, dtype=float)).reshape(-1, 1))
+
+    def greeks(self, s, option_type):
+        """
+        Price, delta and gamma at one or many spots.
+
+        :param s: spot or array of spots.
+        :param option_type: either 'call' or 'put'.
+        :return: dictionary with price, delta and gamma, of shape (spots,) + shape of the strike, or the shape
+            of the strike for a single spot.
+        """
+        spot = asarray(s, dtype=float)
+        e = self.spot_factor(spot)
+        f_1 = self.spot_free_cf[0] * e
+        f_2 = self.spot_free_cf[1] * e
+        shape = spot.shape + self.k.shape
+
+        p_1 = (0.5 + (1 / pi) * real(f_1 @ self.strike_factor)).reshape(shape)
+        p_2 = (0.5 + (1 / pi) * real(f_2 @ self.strike_factor)).reshape(shape)
+        spot = spot.reshape(spot.shape + (1,) * self.k.ndim)
+        # d P_1 / d s: the i * phi of differentiating exp(i * phi * ln(s)) cancels the 1 / (i * phi).
+        gamma = (1 / pi) * real(f_1 @ self.strike_weights).reshape(shape) / spot
+
+        greeks = {'price': spot * p_1 - self.discounted_k * p_2, 'delta': p_1, 'gamma': gamma}
+        if option_type == 'put':
+            greeks['price'] = greeks['price'] - spot + self.discounted_k
+            greeks['delta'] = greeks['delta'] - 1
+        return greeks
+
+    def european_call(self, s=None):
+        """
+        :param s: new spot or array of spots, the model's spot if None.
+        """
+        return self.greeks(self.model.s if s is None else s, 'call')['price']
+
+    def european_put(self, s=None):
+        """
+        :param s: new spot or array of spots, the model's spot if None.
+        """
+        return self.greeks(self.model.s if s is None else s, 'put')['price']
 
-hest11 = HestonModel(s=150,
-                   k=155,
-                   t=15/365,
-                   v=0.0105,
-                   r=0.1,
-                   theta=0.0837,
-                   kappa=74.32,
-                   sigma=3.4532,
-                   rho=-0.8912)
-
-hest_2 = HestonModel(s=1,
-                     k=2,
-                     t=10,
-                     v=0.16,
-                     r=0,
-                     theta=0.16,
-                     kappa=1,
-                     sigma=2,
-                     rho=-0.8)
+    def spot_ladder(self, option_type, shifts=None):
+        """
+        :param shifts: relative spot shifts, -20% to +20% in 1% steps if None.
+        :return: the ladder's spots and the greeks at each of them.
+        """
+        shifts = linspace(-0.2, 0.2, 41) if shifts is None else asarray(shifts, dtype=float)
+        spots = self.model.s * (1 + shifts)
+        return spots, self.greeks(spots, option_type)
@@ -0,0 +1,240 @@
+from numpy import asarray, array, arange, cos, pi, empty, zeros, where, newaxis, broadcast_arrays, \
+    absolute, load, savez, moveaxis, broadcast_shapes, broadcast_to, tensordot
+from numpy.random import default_rng
+from src.options.heston_model.heston_model import HestonModel
+
+# Constructor arguments of the HestonModel that are fixed in a surrogate, in order.
+FIXED_PARAMETERS = ('k', 'r', 'theta', 'kappa', 'sigma', 'rho')
+# Number of points interpolated together.
+EVALUATION_BLOCK = 4096
+
+
+def chebyshev_points(n_nodes, lower, upper):
+    """
+    :return: the n_nodes Chebyshev points of the second kind, the extrema of T_{n-1}, mapped to [lower, upper],
+        in increasing order.
+    """
+    return lower + (upper - lower) * (1 - cos(pi * arange(n_nodes) / (n_nodes - 1))) / 2
+
+
+def barycentric_weights(n_nodes):
+    """
+    :return: barycentric weights of the Chebyshev points of the second kind, (-1)^j halved at both ends. They do
+        not depend on the interval the points are mapped to.
+    """
+    weights = (-1.0) ** arange(n_nodes)
+    weights[[0, -1]] *= 0.5
+    return weights
+
+
+def chebyshev_coefficients(values, axis):
+    """
+    :return: coefficients of the Chebyshev expansion of values at the Chebyshev points along axis, a DCT-I,
+        the degree running along that axis.
+    """
+    values = moveaxis(asarray(values, dtype=float), axis, 0)
+    n_nodes = len(values)
+    # The points run from lower to upper, x_j = -cos(pi * j / (n - 1)), so T_k(x_j) = (-1)^k cos(pi * j * k / (n - 1)).
+    degree = arange(n_nodes)
+    transform = (-1.0) ** degree[:, newaxis] * cos(pi * degree[:, newaxis] * degree / (n_nodes - 1)) * 2 / (n_nodes - 1)
+    # Trapezoid weights, both the first and last point and the first and last degree are halved.
+    transform[:, [0, -1]] *= 0.5
+    transform[[0, -1]] *= 0.5
+    return moveaxis((transform @ values.reshape(n_nodes, -1)).reshape(values.shape), 0, axis)
+
+
+def barycentric_matrix(x, nodes, weights):
+    """
+    Second (true) barycentric form of the interpolant, the interpolated value at x being matrix @ node values.
+
+    :return: array of shape (len(x), len(nodes)), rows with x on a node being the corresponding unit vector.
+    """
+    difference = asarray(x, dtype=float)[:, newaxis] - nodes
+    on_node = difference == 0
+    terms = weights / where(on_node, 1, difference)
+    matrix = terms / terms.sum(axis=1, keepdims=True)
+    rows = on_node.any(axis=1)
+    matrix[rows] = on_node[rows]
+    return matrix
+
+
+class ChebyshevSurrogate:
+
+    def __init__(self, model, option_type, s_range, v_range, t_range, n_nodes=(16, 12, 12), greeks=('price',),
+                 chunk_size=256):
+        """
+        Chebyshev tensor-grid interpolant of a HestonModel's price, and optionally its Greeks, in the spot, the
+        initial variance and the time to maturity, for revaluing millions of scenarios with the strike, rate
+        and model parameters fixed.
+
+        The exact prices are computed once on the tensor product of Chebyshev points with greeks_all, chunk_size
+        points per vectorised call. An evaluation is then the barycentric interpolant in each dimension, small
+        matrices contracted against the node values, instead of a characteristic function integration. In a
+        vectorised call that is a few hundred nanoseconds per point for a scalar t and a couple of microseconds
+        with s, v and t all varying.
+
+        Prices are analytic in s, v and t away from expiry, so the interpolation error falls geometrically with
+        the number of nodes. t_range should not start at 0 where the payoff kink makes the price non-smooth.
+
+        :param model: HestonModel giving k, r, theta, kappa, sigma and rho, its s, v and t are not used.
+        :param option_type: either 'call' or 'put'.
+        :param s_range: (lower, upper) spot range.
+        :param v_range: (lower, upper) initial variance range.
+        :param t_range: (lower, upper) time to maturity range, in years.
+        :param n_nodes: number of Chebyshev points in s, v and t.
+        :param greeks: names of the greeks_all values to interpolate.
+        :param chunk_size: number of grid points priced together.
+        """
+        self.parameters = {name: getattr(model, name) for name in FIXED_PARAMETERS}
+        self.option_type = option_type
+        self.ranges = (tuple(s_range), tuple(v_range), tuple(t_range))
+        self.greeks = tuple(greeks)
+        self.chunk_size = chunk_size
+        self.set_nodes(n_nodes)
+
+    def set_nodes(self, n_nodes):
+        """
+        Places the Chebyshev points, dropping any fitted values.
+        """
+        self.n_nodes = tuple(int(n) for n in n_nodes)
+        self.nodes = [chebyshev_points(n, lower, upper) for (n, (lower, upper)) in zip(self.n_nodes, self.ranges)]
+        self.weights = [barycentric_weights(n) for n in self.n_nodes]
+        self.values = None
+        self.max_error = None
+
+    def exact(self, s, v, t):
+        """
+        :return: dictionary of the interpolated greeks from greeks_all at the points (s, v, t), flat arrays.
+        """
+        (s, v, t) = (asarray(x, dtype=float).ravel() for x in (s, v, t))
+        values = {greek: empty(len(s)) for greek in self.greeks}
+        for start in range(0, len(s), self.chunk_size):
+            chunk = slice(start, start + self.chunk_size)
+            model = HestonModel(s[chunk, newaxis], self.parameters['k'], t[chunk, newaxis], v[chunk, newaxis],
+                                self.parameters['r'], self.parameters['theta'], self.parameters['kappa'],
+                                self.parameters['sigma'], self.parameters['rho'])
+            greeks = model.greeks_all(self.option_type)
+            for greek in self.greeks:
+                values[greek][chunk] = greeks[greek][:, 0]
+        return values
+
+    def fit(self):
+        """
+        Prices every point of the tensor grid, values[greek] having shape n_nodes.
+        """
+        (s, v, t) = broadcast_arrays(self.nodes[0][:, newaxis, newaxis], self.nodes[1][:, newaxis],
+                                     self.nodes[2])
+        self.values = {greek: value.reshape(self.n_nodes) for (greek, value) in self.exact(s, v, t).items()}
+        return self
+
+    def evaluate(self, s, v, t, greek='price'):
+        """
+        :param s: spots, broadcast against v and t.
+        :param v: initial variances.
+        :param t: times to maturity.
+        :param greek: one of the interpolated greeks.
+        :return: the interpolated values with the broadcast shape of s, v and t. Points outside the ranges are
+            extrapolated, with no accuracy guarantee.
+        """
+        inputs = [asarray(x, dtype=float) for x in (s, v, t)]
+        shape = broadcast_shapes(*(x.shape for x in inputs))
+
+        # A scalar input, typically the horizon's t, is contracted into the node values once for every point.
+        values = self.values[greek]
+        for axis in reversed(range(3)):
+            if inputs[axis].size == 1:
+                row = barycentric_matrix(inputs[axis].ravel(), self.nodes[axis], self.weights[axis])[0]
+                values = tensordot(values, row, axes=([axis], [0]))
+        varying = [axis for axis in range(3) if inputs[axis].size > 1]
+        if not varying:
+            return broadcast_to(values, shape).copy()
+
+        points = [broadcast_to(inputs[axis], shape).ravel() for axis in varying]
+        result = empty(len(points[0]))
+        # Blocks keep the (points, nodes) intermediates in cache.
+        for start in range(0, len(result), EVALUATION_BLOCK):
+            block = slice(start, start + EVALUATION_BLOCK)
+            (first, *others) = (barycentric_matrix(x[block], self.nodes[axis], self.weights[axis])
+                                for (x, axis) in zip(points, varying))
+            partial = first @ values.reshape(len(values), -1)
+            for matrix in others:
+                partial = (partial.reshape(len(matrix), matrix.shape[1], -1) * matrix[:, :, newaxis]).sum(axis=1)
+            result[block] = partial.reshape(-1)
+        return result.reshape(shape)
+
+    def check(self, n_points=2000, seed=0):
+        """
+        Largest absolute error of the surrogate against greeks_all at random points of the ranges, plus the
+        8 corners of the box, where polynomial interpolation errors tend to be largest.
+
+        :return: dictionary of the largest error of every greek, also kept in max_error.
+        """
+        generator = default_rng(seed)
+        corners = array([[a, b, c] for a in range(2) for b in range(2) for c in range(2)], dtype=float)
+        unit = zeros((n_points + len(corners), 3))
+        unit[:n_points] = generator.random((n_points, 3))
+        unit[n_points:] = corners
+        (s, v, t) = (lower + (upper - lower) * unit[:, i] for (i, (lower, upper)) in enumerate(self.ranges))
+
+        exact = self.exact(s, v, t)
+        self.max_error = {greek: absolute(self.evaluate(s, v, t, greek) - exact[greek]).max()
+                          for greek in self.greeks}
+        return self.max_error
+
+    def tail_coefficients(self):
+        """
+        :return: for s, v and t, the largest absolute Chebyshev coefficient of the two highest degrees in that
+            dimension over every greek and grid line. They bound what the dimension still leaves unresolved.
+        """
+        return [max(absolute(chebyshev_coefficients(value, axis)[(slice(None),) * axis + (slice(-2, None),)]).max()
+                    for value in self.values.values())
+                for axis in range(3)]
+
+    def build(self, tolerance, max_nodes=64, n_points=2000, seed=0):
+        """
+        Fits and checks the surrogate until the checked error of every greek is below tolerance. After each fit
+        the dimensions whose tail_coefficients are above tolerance get half as many nodes again, or every
+        dimension when none of them is.
+
+        :param tolerance: largest absolute error accepted.
+        :param max_nodes: largest number of nodes in one dimension.
+        :return: self, with max_error being the checked errors.
+        """
+        while True:
+            self.fit()
+            self.check(n_points, seed)
+            if max(self.max_error.values()) <= tolerance:
+                return self
+            tails = self.tail_coefficients()
+            refine = [tail > tolerance for tail in tails] if max(tails) > tolerance else [True] * 3
+            n_nodes = tuple(min(max_nodes, n + (n + 1) // 2) if grow else n for (n, grow) in zip(self.n_nodes, refine))
+            if n_nodes == self.n_nodes:
+                raise ValueError("surrogate error {:.3g} is above the tolerance {:.3g} with {} nodes".format(
+                    max(self.max_error.values()), tolerance, self.n_nodes))
+            self.set_nodes(n_nodes)
+
+    def save(self, path):
+        """
+        Writes the node values, ranges, fixed parameters and checked errors to an .npz file, see load_surrogate.
+        """
+        savez(path, option_type=self.option_type, ranges=array(self.ranges), n_nodes=array(self.n_nodes),
+              greeks=array(self.greeks), chunk_size=self.chunk_size,
+              parameters=array([self.parameters[name] for name in FIXED_PARAMETERS], dtype=float),
+              max_error=array([(self.max_error or {}).get(greek, float('nan')) for greek in self.greeks]),
+              **{'values_' + greek: value for (greek, value) in self.values.items()})
+
+
+def load_surrogate(path):
+    """
+    :return: the ChebyshevSurrogate saved at path, ready to evaluate without pricing anything.
+    """
+    with load(path) as saved:
+        parameters = dict(zip(FIXED_PARAMETERS, saved['parameters']))
+        model = HestonModel(None, parameters['k'], None, None, parameters['r'], parameters['theta'],
+                            parameters['kappa'], parameters['sigma'], parameters['rho'])
+        surrogate = ChebyshevSurrogate(model, str(saved['option_type']), *saved['ranges'],
+                                       n_nodes=saved['n_nodes'], greeks=saved['greeks'].tolist(),
+                                       chunk_size=int(saved['chunk_size']))
+        surrogate.values = {greek: saved['values_' + greek] for greek in surrogate.greeks}
+        surrogate.max_error = dict(zip(surrogate.greeks, saved['max_error'].tolist()))
+    return surrogate
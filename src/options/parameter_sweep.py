@@ -0,0 +1,95 @@
+from concurrent.futures import ProcessPoolExecutor
+from numpy import asarray, broadcast_to, meshgrid, concatenate, newaxis
+from src.options.black_scholes.black_scholes import BlackScholes
+from src.options.heston_model.heston_model import HestonModel
+
+# Constructor arguments of each pricer, in order.
+PARAMETER_NAMES = {
+    BlackScholes: ('s', 'k', 't', 'sigma', 'd', 'r'),
+    HestonModel: ('s', 'k', 't', 'v', 'r', 'theta', 'kappa', 'sigma', 'rho'),
+}
+
+
+class ParameterSweep:
+    def __init__(self, model, initial_condition, option_type, workers=1, chunk_size=256):
+        """
+        Price and Greeks of a pricer over a 1D curve or a 2D surface of one or two of its parameters.
+
+        Every point is evaluated in vectorised batches rather than one pricer object per point:
+            - BlackScholes: one european_batch over all the points.
+            - HestonModel: greeks_all with (S, 1) parameter arrays, chunk_size points at a time, the chunks being
+            farmed out to a process pool when workers > 1.
+
+        :param model: BlackScholes or HestonModel.
+        :param initial_condition: the constructor arguments of the model, in order, for the parameters that are
+            not swept.
+        :param option_type: either "call" or "put".
+        :param workers: number of processes the Heston chunks are evaluated in.
+        :param chunk_size: number of Heston points priced together.
+        """
+        self.model = model
+        self.parameters = dict(zip(PARAMETER_NAMES[model], initial_condition))
+        self.option_type = option_type
+        self.workers = workers
+        self.chunk_size = chunk_size
+
+    def points(self, parameter, values, parameter_2=None, values_2=None):
+        """
+        :return: the constructor arguments of every point as flat arrays, and the shape of the sweep.
+        """
+        values = asarray(values, dtype=float)
+        swept = {parameter: values}
+        shape = values.shape
+        if parameter_2 is not None:
+            (swept[parameter], swept[parameter_2]) = meshgrid(values, asarray(values_2, dtype=float), indexing='ij')
+            shape = swept[parameter].shape
+
+        arguments = [broadcast_to(asarray(swept.get(name, self.parameters[name]), dtype=float), shape).ravel()
+                     for name in PARAMETER_NAMES[self.model]]
+        return arguments, shape
+
+    def heston_chunk(self, arguments):
+        greeks = HestonModel(*(argument[:, newaxis] for argument in arguments)).greeks_all(self.option_type)
+        return {name: value[:, 0] for (name, value) in greeks.items()}
+
+    def evaluate(self, parameter, values, parameter_2=None, values_2=None):
+        """
+        :param parameter: name of the swept parameter, e.g. 's'.
+        :param values: its values.
+        :param parameter_2: name of a second swept parameter for a surface, None for a curve.
+        :param values_2: its values.
+        :return: dictionary of the price and every Greek, each of shape (len(values),) or
+            (len(values), len(values_2)).
+        """
+        (arguments, shape) = self.points(parameter, values, parameter_2, values_2)
+
+        if self.model is BlackScholes:
+            greeks = BlackScholes(*arguments).european_batch(self.option_type)
+        else:
+            n_points = len(arguments[0])
+            chunks = [[argument[start:start + self.chunk_size] for argument in arguments]
+                      for start in range(0, n_points, self.chunk_size)]
+            if self.workers == 1:
+                results = list(map(self.heston_chunk, chunks))
+            else:
+                with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                    results = list(pool.map(self.heston_chunk, chunks))
+            greeks = {name: concatenate([result[name] for result in results]) for name in results[0]}
+
+        return {name: value.reshape(shape) for (name, value) in greeks.items()}
+
+    def frame(self, parameter, values, parameter_2=None, values_2=None):
+        """
+        :return: the sweep as a pandas DataFrame, one row per point with the swept parameters and every Greek.
+        """
+        import pandas as pd
+
+        greeks = self.evaluate(parameter, values, parameter_2, values_2)
+        (arguments, shape) = self.points(parameter, values, parameter_2, values_2)
+        columns = dict(zip(PARAMETER_NAMES[self.model], arguments))
+
+        data = {parameter: columns[parameter]}
+        if parameter_2 is not None:
+            data[parameter_2] = columns[parameter_2]
+        data.update({name: value.ravel() for (name, value) in greeks.items()})
+        return pd.DataFrame(data)
@@ -1,8 +1,15 @@
-from numpy import zeros, random, sqrt
+import time
+
+from numpy import sqrt, exp, log, full, empty, absolute, asarray, searchsorted, maximum, where, \
+    concatenate, r_
+from scipy.special import ndtr
+from src import instrumentation
+from src.processes.random_generators import PseudoRandomGenerator
+
 
 class HestonProcess:
 
-    def __init__(self, s, k, t, v, r, theta, kappa, sigma, rho):
+    def __init__(self, s, k, t, v, r, theta, kappa, sigma, rho, seed=None, scheme='euler', generator=None):
         """
         :param s: stock price
         :param k: strike price
@@ -13,6 +20,13 @@ class HestonProcess:
         :param kappa: mean reversion (speed) of variance to long run average
         :param sigma: volatility of volatility (vvol)
         :param rho: correlation between the brownian motion of the stock price and the volatility.
+        :param seed: seed of the process' random number generator, used when no generator is given.
+        :param scheme: discretisation of the variance, one of
+            - 'euler': Euler step reflected at zero with abs().
+            - 'full_truncation': Euler step that uses max(v, 0) in the drift and diffusion, Lord et al. (2010).
+            - 'qe': Andersen's quadratic-exponential scheme with martingale correction, Andersen (2008).
+        :param generator: source of the normals, e.g. a SobolGenerator, see random_generators. Pseudo-random
+            normals seeded with seed if None.
         """
         self.s = s
         self.k = k
@@ -23,41 +37,168 @@ class HestonProcess:
         self.kappa = kappa
         self.sigma = sigma
         self.rho = rho
+        self.generator = PseudoRandomGenerator(seed) if generator is None else generator
+        self.scheme = scheme
 
-    def diffusion(self, time_steps, simulations):
-        dt = self.t / time_steps
+    def step(self, log_s, v, z_v, z_s, dt):
+        """
+        Advance log(s) and v by one time step in place, with the scheme chosen at construction.
 
-        s = zeros((simulations, time_steps))
-        s[:, 0] = self.s
+        :param z_v: standard normals driving the variance.
+        :param z_s: standard normals independent of z_v, the stock is driven by rho * z_v + sqrt(1 - rho^2) * z_s.
+        """
+        if self.scheme == 'qe':
+            self.qe_step(log_s, v, z_v, z_s, dt)
+        elif self.scheme == 'full_truncation':
+            self.full_truncation_step(log_s, v, z_v, z_s, dt)
+        else:
+            self.euler_step(log_s, v, z_v, z_s, dt)
 
-        v = zeros((simulations, time_steps))
-        v[:, 0] = self.v
+    def euler_step(self, log_s, v, z_v, z_s, dt):
+        """
+        Euler step of the variance reflected at zero and log-Euler step of the stock.
+        """
+        sqrt_v_dt = sqrt(v * dt)
 
-        w1 = random.standard_normal((simulations, time_steps))
+        log_s += (self.r - 0.5 * v) * dt + sqrt_v_dt * (self.rho * z_v + sqrt(1 - self.rho**2) * z_s)
+        v += self.kappa * (self.theta - v) * dt + self.sigma * sqrt_v_dt * z_v
+        absolute(v, out=v)
 
-        z2 = random.standard_normal((simulations, time_steps))
-        w2 = self.rho * w1 + (sqrt(1-self.rho**2)) * z2
+    def full_truncation_step(self, log_s, v, z_v, z_s, dt):
+        """
+        Full truncation Euler, Lord, Koekkoek & van Dijk (2010). The variance is allowed to go negative but only
+        its positive part enters the drift and the diffusion, which has the smallest bias of the Euler fixes.
+        """
+        v_plus = maximum(v, 0)
+        sqrt_v_dt = sqrt(v_plus * dt)
 
-        for i in range(0, time_steps-1):
-            v[:, i + 1] = abs(
-                                v[:, i] +
-                                self.kappa * (self.theta - v[:, i]) * dt +
-                                self.sigma * sqrt(v[:, i]) * w2[:, i] * sqrt(dt)
-            )
+        log_s += (self.r - 0.5 * v_plus) * dt + sqrt_v_dt * (self.rho * z_v + sqrt(1 - self.rho**2) * z_s)
+        v += self.kappa * (self.theta - v_plus) * dt + self.sigma * sqrt_v_dt * z_v
 
-            s[:, i + 1] = s[:, i] + \
-                          self.r * self.s * dt + \
-                          self.sigma * sqrt(v[:, i + 1]) * w2[:, i]
+    def qe_step(self, log_s, v, z_v, z_s, dt, psi_critical=1.5):
+        """
+        Quadratic-exponential step, Andersen (2008) "Efficient Simulation of the Heston Stochastic Volatility Model".
+        Link: https://papers.ssrn.com/sol3/papers.cfm?abstract_id=946405
 
-        return s, v
+        The next variance is moment matched to the exact non-central chi-squared transition: a squared normal
+        when the variance is large relative to its spread (psi <= psi_critical), otherwise a point mass at zero
+        mixed with an exponential. The stock uses the trapezoidal (gamma_1 = gamma_2 = 0.5) integrated variance
+        and the martingale corrected K_0, so E[S(t + dt) | S(t)] = S(t) * exp(r * dt) exactly.
+        """
+        e_kt = exp(-self.kappa * dt)
+        m = self.theta + (v - self.theta) * e_kt
+        s2 = v * self.sigma**2 * e_kt * (1 - e_kt) / self.kappa + \
+            self.theta * self.sigma**2 * (1 - e_kt)**2 / (2 * self.kappa)
+        psi = s2 / m**2
+        quadratic = psi <= psi_critical
 
+        # Quadratic branch, v(t + dt) = a * (b + z_v)^2.
+        psi_q = where(quadratic, psi, 1)
+        b2 = 2 / psi_q - 1 + sqrt(2 / psi_q) * sqrt(2 / psi_q - 1)
+        a = m / (1 + b2)
+        # Exponential branch, v(t + dt) = 0 with probability p, otherwise exponential with rate beta.
+        p = where(quadratic, 0, (psi - 1) / (psi + 1))
+        beta = (1 - p) / m
+        u = ndtr(z_v)
+        v_exponential = where(u <= p, 0, log((1 - p) / maximum(1 - u, 1e-300)) / beta)
+        v_next = where(quadratic, a * (sqrt(b2) + z_v)**2, v_exponential)
 
-hest = HestonProcess(s=150,
-                     k=155,
-                     t=15/365,
-                     v=0.0105,
-                     r=0.1,
-                     theta=0.0837,
-                     kappa=74.32,
-                     sigma=3.4532,
-                     rho=-0.8912)
+        k1 = 0.5 * dt * (self.kappa * self.rho / self.sigma - 0.5) - self.rho / self.sigma
+        k2 = 0.5 * dt * (self.kappa * self.rho / self.sigma - 0.5) + self.rho / self.sigma
+        k3 = 0.5 * dt * (1 - self.rho**2)
+        k4 = 0.5 * dt * (1 - self.rho**2)
+
+        # Martingale correction, K_0 = -log E[exp(A * v(t + dt))] - (K_1 + K_3 / 2) * v(t) with A = K_2 + K_4 / 2.
+        big_a = k2 + 0.5 * k4
+        k0 = where(quadratic,
+                   -big_a * b2 * a / (1 - 2 * big_a * a) + 0.5 * log(1 - 2 * big_a * a),
+                   -log(p + beta * (1 - p) / (beta - big_a))) - (k1 + 0.5 * k3) * v
+
+        log_s += self.r * dt + k0 + k1 * v + k2 * v_next + sqrt(k3 * v + k4 * v_next) * z_s
+        v[:] = v_next
+
+    def log_stock_std(self, v, v_next, dt):
+        """
+        :return: standard deviation of the log stock step given the variance path, i.e. the factor multiplying z_s
+            in the step from v to v_next.
+        """
+        if self.scheme == 'qe':
+            return sqrt(0.5 * dt * (1 - self.rho**2) * (v + v_next))
+        return sqrt((1 - self.rho**2) * maximum(v, 0) * dt)
+
+    def diffusion_streaming(self, time_steps, simulations, observation_steps=None, chunk_size=None,
+                            antithetic=False, score=False):
+        """
+        Simulate the paths while keeping only the current state. Normals are drawn one time step at a time and
+        the state is stepped forward in place, so memory is O(simulations) rather than O(simulations * time_steps).
+
+        :param time_steps: number of time steps to maturity.
+        :param simulations: number of paths.
+        :param observation_steps: increasing time step indices, 0 to time_steps, at which s and v are recorded.
+            None records only the terminal value.
+        :param chunk_size: number of paths simulated together, all of them if None.
+        :param antithetic: if True, path i + simulations / 2 is driven by the negated normals of path i.
+            simulations must be even.
+        :param score: also return the likelihood ratio score d log p / d s of every path. Given the variance path
+            the first log stock step is normal, so the score is z_s / (s * log_stock_std) of the first step.
+        :return: s and v of shape (simulations,) at maturity, or (simulations, len(observation_steps)), and the
+            score of shape (simulations,) if asked for.
+        """
+        if antithetic and simulations % 2:
+            raise ValueError("antithetic simulation needs an even number of paths, got {}".format(simulations))
+
+        start_time = time.perf_counter()
+        dt = self.t / time_steps
+        observations = asarray([time_steps] if observation_steps is None else observation_steps)
+        chunk_size = simulations if chunk_size is None else chunk_size
+        # Normals drawn per step; with antithetics each draw drives a path and its mirror.
+        drawn = simulations // 2 if antithetic else simulations
+        chunk_drawn = max(chunk_size // 2, 1) if antithetic else chunk_size
+
+        s = empty((simulations, len(observations)))
+        v = empty((simulations, len(observations)))
+        path_score = empty(simulations)
+        for start in range(0, drawn, chunk_drawn):
+            stop = min(start + chunk_drawn, drawn)
+            paths = r_[start:stop, drawn + start:drawn + stop] if antithetic else slice(start, stop)
+            n_paths = 2 * (stop - start) if antithetic else stop - start
+
+            log_s_t = full(n_paths, log(self.s))
+            v_t = full(n_paths, float(self.v))
+            normals = self.generator.steps(stop - start, time_steps)
+            for i in range(time_steps + 1):
+                if i > 0:
+                    (z_v, z_s) = next(normals)
+                    if antithetic:
+                        (z_v, z_s) = (concatenate((z_v, -z_v)), concatenate((z_s, -z_s)))
+                    if i == 1 and score:
+                        v_0 = v_t.copy()
+                        self.step(log_s_t, v_t, z_v, z_s, dt)
+                        path_score[paths] = z_s / (self.s * self.log_stock_std(v_0, v_t, dt))
+                    else:
+                        self.step(log_s_t, v_t, z_v, z_s, dt)
+                for column in range(searchsorted(observations, i, 'left'), searchsorted(observations, i, 'right')):
+                    s[paths, column] = exp(log_s_t)
+                    v[paths, column] = v_t
+
+        if instrumentation.enabled:
+            seconds = time.perf_counter() - start_time
+            registry = instrumentation.REGISTRY
+            registry.count('simulation.paths', simulations)
+            registry.observe('simulation.seconds', seconds)
+            registry.observe('simulation.paths_per_second', simulations / seconds)
+            registry.event('simulation', scheme=self.scheme, simulations=simulations, time_steps=time_steps,
+                           chunk_size=chunk_size, antithetic=antithetic, generator=type(self.generator).__name__,
+                           seconds=seconds)
+
+        if observation_steps is None:
+            (s, v) = (s[:, 0], v[:, 0])
+        if score:
+            return s, v, path_score
+        return s, v
+
+    def diffusion(self, time_steps, simulations):
+        """
+        :return: the full paths of s and v, of shape (simulations, time_steps + 1) including the initial values.
+        """
+        return self.diffusion_streaming(time_steps, simulations, observation_steps=range(time_steps + 1))
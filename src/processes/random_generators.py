@@ -0,0 +1,124 @@
+from numpy import random, sqrt, empty, zeros, diff, clip
+from scipy.special import ndtri
+
+
+class PseudoRandomGenerator:
+
+    def __init__(self, seed=None):
+        """
+        Independent standard normals from NumPy's default bit generator, drawn one time step at a time.
+
+        :param seed: seed, SeedSequence or Generator of the normals.
+        """
+        self.rng = random.default_rng(seed)
+
+    def steps(self, paths, time_steps):
+        """
+        :param paths: number of paths.
+        :param time_steps: number of time steps.
+        :return: iterator over the time steps of the normals (z_v, z_s), each of shape (paths,), driving the
+            variance and the stock.
+        """
+        for i in range(time_steps):
+            yield self.rng.standard_normal((2, paths))
+
+
+class BrownianBridge:
+
+    def __init__(self, time_steps):
+        """
+        Brownian bridge construction of a Brownian motion on time_steps equal steps. The terminal value is built
+        first and then the midpoints of the widest gaps, so the first normals set the coarse shape of the path.
+        This concentrates the variance of the payoff in the first, best distributed, dimensions of a
+        quasi-random sequence.
+
+        :param time_steps: number of time steps.
+        """
+        self.time_steps = time_steps
+        # For every construction step: the point built, its left and right neighbours (-1 being time 0, where
+        # the motion is 0) and the conditional mean weights and standard deviation in units of dt.
+        self.index = empty(time_steps, dtype=int)
+        self.left = empty(time_steps, dtype=int)
+        self.right = empty(time_steps, dtype=int)
+        self.left_weight = zeros(time_steps)
+        self.right_weight = zeros(time_steps)
+        self.std = empty(time_steps)
+
+        self.index[0] = time_steps - 1
+        self.left[0] = -1
+        self.right[0] = -1
+        self.std[0] = sqrt(time_steps)
+
+        gaps = [(-1, time_steps - 1)]
+        built = 1
+        while built < time_steps:
+            next_gaps = []
+            for (left, right) in gaps:
+                if right - left < 2:
+                    continue
+                middle = (left + right + 1) // 2
+                self.index[built] = middle
+                self.left[built] = left
+                self.right[built] = right
+                self.left_weight[built] = (right - middle) / (right - left)
+                self.right_weight[built] = (middle - left) / (right - left)
+                self.std[built] = sqrt((middle - left) * (right - middle) / (right - left))
+                built += 1
+                next_gaps += [(left, middle), (middle, right)]
+            gaps = next_gaps
+
+    def increments(self, z):
+        """
+        :param z: standard normals of shape (time_steps, paths), in construction order.
+        :return: the standardised increments (W(i + 1) - W(i)) / sqrt(dt), of shape (time_steps, paths), which are
+            again independent standard normals.
+        """
+        w = zeros((self.time_steps + 1, z.shape[1]))
+        # Row 0 of w is time 0, so point i of the construction is row i + 1.
+        for j in range(self.time_steps):
+            w[self.index[j] + 1] = self.left_weight[j] * w[self.left[j] + 1] + \
+                self.right_weight[j] * w[self.right[j] + 1] + self.std[j] * z[j]
+        return diff(w, axis=0)
+
+
+class SobolGenerator:
+
+    def __init__(self, seed=None, brownian_bridge=True):
+        """
+        Scrambled Sobol points mapped to standard normals with the inverse normal distribution. A path of
+        time_steps steps is one point in 2 * time_steps dimensions, the variance and the stock normals of each
+        step being interleaved so that both factors get the leading dimensions.
+
+        Successive calls continue the same sequence, so paths should be requested in powers of two to keep the
+        balance properties of the Sobol points. Every seed gives an independent scrambling, which is what
+        randomised QMC replications use for error estimates.
+
+        :param seed: seed, SeedSequence or Generator of the Owen scrambling.
+        :param brownian_bridge: build each factor's path with a Brownian bridge rather than step by step.
+        """
+        self.rng = random.default_rng(seed)
+        self.brownian_bridge = brownian_bridge
+        self.sampler = None
+
+    def steps(self, paths, time_steps):
+        """
+        :param paths: number of paths.
+        :param time_steps: number of time steps.
+        :return: iterator over the time steps of the normals (z_v, z_s), each of shape (paths,), driving the
+            variance and the stock.
+        """
+        # scipy.stats takes a second to import, only pay for it when QMC is used.
+        from scipy.stats import qmc
+
+        if self.sampler is None or self.sampler.d != 2 * time_steps:
+            self.sampler = qmc.Sobol(2 * time_steps, scramble=True, seed=self.rng)
+        u = self.sampler.random(paths)
+        z = ndtri(clip(u, 1e-16, 1 - 1e-16)).T.reshape(time_steps, 2, paths)
+
+        if self.brownian_bridge:
+            bridge = BrownianBridge(time_steps)
+            for factor in range(2):
+                z[:, factor] = bridge.increments(z[:, factor])
+
+        for i in range(time_steps):
+            yield z[i]
@@ -0,0 +1,78 @@
+from numpy import asarray, zeros, log
+
+
+class Portfolio:
+
+    def __init__(self):
+        """
+        A book of option positions. Each position is a priced option object, BlackScholes or HestonModel, with
+        the underlying it is written on, so scenario moves of that underlying can be applied to it.
+        """
+        self.positions = []
+
+    def add(self, underlying, option, option_type, quantity=1):
+        """
+        :param underlying: name of the underlying, one of the MarketScenarios underlyings.
+        :param option: BlackScholes or HestonModel of the contract, its s, k, t, r and volatility parameters
+            are today's market.
+        :param option_type: either "call" or "put".
+        :param quantity: number of contracts held, negative for a short position.
+        """
+        self.positions.append((underlying, option, option_type, quantity))
+
+    def __len__(self):
+        return len(self.positions)
+
+
+class MarketScenarios:
+
+    def __init__(self, underlyings, spot_returns, vol_shifts=None, rate_shifts=None):
+        """
+        A matrix of market moves, one row per scenario.
+
+        :param underlyings: names of the underlyings, one per column of spot_returns and vol_shifts.
+        :param spot_returns: log returns of the spots, of shape (scenarios, underlyings).
+        :param vol_shifts: absolute shifts of the volatility, of shape (scenarios, underlyings). The implied
+            volatility for BlackScholes and sqrt(v) for HestonModel. No shift if None.
+        :param rate_shifts: parallel shifts of the risk free rate, of shape (scenarios,). No shift if None.
+        """
+        self.underlyings = list(underlyings)
+        self.spot_returns = asarray(spot_returns, dtype=float).reshape(-1, len(self.underlyings))
+        n_scenarios = len(self.spot_returns)
+        self.vol_shifts = zeros(self.spot_returns.shape) if vol_shifts is None else \
+            asarray(vol_shifts, dtype=float).reshape(self.spot_returns.shape)
+        self.rate_shifts = zeros(n_scenarios) if rate_shifts is None else \
+            asarray(rate_shifts, dtype=float).reshape(n_scenarios)
+
+    def __len__(self):
+        return len(self.spot_returns)
+
+    def index(self, underlying):
+        return self.underlyings.index(underlying)
+
+    def block(self, start, stop):
+        """
+        :return: the scenarios start to stop as a MarketScenarios.
+        """
+        return MarketScenarios(self.underlyings, self.spot_returns[start:stop], self.vol_shifts[start:stop],
+                               self.rate_shifts[start:stop])
+
+
+def historical_scenarios(underlyings, prices, horizon=1, vols=None, rates=None):
+    """
+    Historical simulation scenarios from aligned daily histories, overlapping over the horizon.
+
+    :param underlyings: names of the columns of prices.
+    :param prices: spot prices of shape (days, underlyings).
+    :param horizon: holding period in days.
+    :param vols: optional volatility histories of shape (days, underlyings), their changes are the vol shifts.
+    :param rates: optional risk free rate history of shape (days,), its changes are the rate shifts.
+    """
+    def changes(history):
+        history = asarray(history, dtype=float)
+        return history[horizon:] - history[:-horizon]
+
+    return MarketScenarios(underlyings,
+                           changes(log(asarray(prices, dtype=float))),
+                           None if vols is None else changes(vols),
+                           None if rates is None else changes(rates))
@@ -0,0 +1,157 @@
+from numpy import array, zeros, sqrt, trace, cov, column_stack, maximum, linspace, random, newaxis
+from numpy.linalg import eigh, matrix_power
+from math import factorial
+from scipy.special import ndtri
+from src.options.black_scholes.black_scholes import BlackScholes
+from src.options.heston_model.heston_model import HestonModel
+from src.risk.value_at_risk import risk_measures
+
+
+class DeltaGammaVegaVaR:
+
+    def __init__(self, portfolio, underlyings, n_nodes=128):
+        """
+        Sensitivity based VaR. The portfolio's Greeks are aggregated once into a delta vector and a gamma matrix
+        over the risk factors, after which a VaR for any factor covariance matrix costs a few small matrix
+        products.
+
+        The risk factors are the log return of every underlying's spot, the absolute shift of every underlying's
+        volatility and a parallel rate shift, in that order, as in MarketScenarios. To second order in the spot
+        log return x, dS = S (x + x^2 / 2), so the P&L is
+            dV = sum delta * S * x + 1/2 (gamma * S^2 + delta * S) x^2 + vega * dvol + rho * dr.
+        HestonModel's vega is d price / d v, which is mapped to the volatility sqrt(v) with dv / dvol = 2 sqrt(v).
+
+        :param portfolio: Portfolio of BlackScholes and HestonModel positions.
+        :param underlyings: names of the underlyings, in the order of the factors.
+        :param n_nodes: number of Gauss-Legendre nodes of HestonModel.greeks_all.
+        """
+        self.underlyings = list(underlyings)
+        n = len(self.underlyings)
+        self.n_factors = 2 * n + 1
+        self.delta = zeros(self.n_factors)
+        self.gamma = zeros((self.n_factors, self.n_factors))
+
+        black_scholes = [position for position in portfolio.positions if isinstance(position[1], BlackScholes)]
+        if black_scholes:
+            (s, k, t, sigma, d, r) = (array([getattr(position[1], name) for position in black_scholes], dtype=float)
+                                      for name in ('s', 'k', 't', 'sigma', 'd', 'r'))
+            greeks = BlackScholes(s, k, t, sigma, d, r).european_batch(array([p[2] for p in black_scholes]))
+            for (i, position) in enumerate(black_scholes):
+                self.add_sensitivities(position[0], position[3], s[i], greeks['delta'][i], greeks['gamma'][i],
+                                       greeks['vega'][i], greeks['rho'][i])
+
+        for (underlying, option, option_type, quantity) in portfolio.positions:
+            if isinstance(option, HestonModel):
+                greeks = option.greeks_all(option_type, n_nodes)
+                self.add_sensitivities(underlying, quantity, option.s, greeks['delta'], greeks['gamma'],
+                                       2 * sqrt(option.v) * greeks['vega'], greeks['rho'])
+
+    def add_sensitivities(self, underlying, quantity, s, delta, gamma, vega, rho):
+        spot = self.underlyings.index(underlying)
+        vol = len(self.underlyings) + spot
+        self.delta[spot] += quantity * delta * s
+        self.delta[vol] += quantity * vega
+        self.delta[-1] += quantity * rho
+        self.gamma[spot, spot] += quantity * (gamma * s**2 + delta * s)
+
+    def pnl(self, factors):
+        """
+        :param factors: factor moves of shape (scenarios, factors).
+        :return: the delta-gamma-vega P&L of every scenario.
+        """
+        return factors @ self.delta + 0.5 * ((factors @ self.gamma) * factors).sum(axis=1)
+
+    def cumulants(self, covariance):
+        """
+        First four cumulants of the P&L for normal factor moves x ~ N(0, covariance), from the quadratic form
+        delta' x + x' gamma x / 2:
+            kappa_1 = tr(gamma covariance) / 2
+            kappa_r = (r - 1)! / 2 tr((gamma covariance)^r) + r! / 2 delta' covariance (gamma covariance)^(r - 2) delta
+        """
+        gamma_covariance = self.gamma @ covariance
+        cumulants = [0.5 * trace(gamma_covariance)]
+        for r in (2, 3, 4):
+            cumulants.append(0.5 * factorial(r - 1) * trace(matrix_power(gamma_covariance, r)) +
+                             0.5 * factorial(r) * self.delta @ covariance @ matrix_power(gamma_covariance, r - 2) @
+                             self.delta)
+        return cumulants
+
+    def cornish_fisher(self, covariance, confidence_levels=(0.95, 0.99), tail_points=1000):
+        """
+        VaR from the Cornish-Fisher expansion of the P&L quantiles in its skewness and excess kurtosis. The
+        expected shortfall averages the expanded quantiles over the tail.
+
+        :param covariance: covariance matrix of the factor moves over the horizon.
+        :param tail_points: number of quantiles averaged for the expected shortfall.
+        :return: dicts of the value_at_risk and expected_shortfall keyed by confidence level.
+        """
+        (mean, variance, third, fourth) = self.cumulants(covariance)
+        std = sqrt(variance)
+        skew = third / std**3 if std > 0 else 0
+        kurtosis = fourth / std**4 if std > 0 else 0
+
+        def pnl_quantile(probability):
+            z = ndtri(probability)
+            w = z + (z**2 - 1) * skew / 6 + (z**3 - 3 * z) * kurtosis / 24 - (2 * z**3 - 5 * z) * skew**2 / 36
+            return mean + std * w
+
+        value_at_risk = {}
+        expected_shortfall = {}
+        for level in confidence_levels:
+            tail = 1 - level
+            value_at_risk[level] = -pnl_quantile(tail)
+            # Midpoints of tail_points equal slices of the tail probability.
+            expected_shortfall[level] = -pnl_quantile(tail * (linspace(0, 1, tail_points, endpoint=False) +
+                                                              0.5 / tail_points)).mean()
+        return value_at_risk, expected_shortfall
+
+    def monte_carlo(self, covariance, confidence_levels=(0.95, 0.99), simulations=100000, seed=None):
+        """
+        VaR from simulating normal factor moves through the quadratic form, which keeps the full distribution of
+        the delta-gamma P&L rather than its first four cumulants.
+
+        :param covariance: covariance matrix of the factor moves over the horizon.
+        :return: dicts of the value_at_risk and expected_shortfall keyed by confidence level.
+        """
+        # Symmetric square root, which unlike the Cholesky factor accepts singular covariances.
+        (eigenvalues, eigenvectors) = eigh(covariance)
+        root = eigenvectors * sqrt(maximum(eigenvalues, 0))
+        factors = random.default_rng(seed).standard_normal((simulations, self.n_factors)) @ root.T
+        return risk_measures(self.pnl(factors), confidence_levels)
+
+    def drift(self, scenarios, full_revaluation, confidence_levels=(0.95, 0.99)):
+        """
+        How far the sensitivity approximation is from a full revaluation over the same scenarios.
+
+        :param scenarios: the MarketScenarios the full revaluation was run on.
+        :param full_revaluation: result of FullRevaluationVaR.run.
+        :return: dict with the per scenario P&L error of the approximation (pnl_error) and, keyed by confidence
+            level, the VaR and ES of the approximation and their differences to the full revaluation.
+        """
+        pnl = self.pnl(scenario_factors(scenarios, self.underlyings))
+        (value_at_risk, expected_shortfall) = risk_measures(pnl, confidence_levels)
+        return {'pnl_error': pnl - full_revaluation['pnl'],
+                'value_at_risk': value_at_risk,
+                'expected_shortfall': expected_shortfall,
+                'value_at_risk_drift': {level: value_at_risk[level] - full_revaluation['value_at_risk'][level]
+                                        for level in confidence_levels},
+                'expected_shortfall_drift': {level: expected_shortfall[level] -
+                                             full_revaluation['expected_shortfall'][level]
+                                             for level in confidence_levels}}
+
+
+def scenario_factors(scenarios, underlyings):
+    """
+    :return: the factor moves of the MarketScenarios in the factor order of DeltaGammaVegaVaR, of shape
+        (scenarios, 2 * underlyings + 1).
+    """
+    columns = [scenarios.index(underlying) for underlying in underlyings]
+    return column_stack((scenarios.spot_returns[:, columns], scenarios.vol_shifts[:, columns],
+                         scenarios.rate_shifts[:, newaxis]))
+
+
+def factor_covariance(scenarios, underlyings):
+    """
+    :return: sample covariance of the factor moves of the MarketScenarios.
+    """
+    return cov(scenario_factors(scenarios, underlyings), rowvar=False)
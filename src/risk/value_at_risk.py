@@ -0,0 +1,177 @@
+from numpy import asarray, array, empty, zeros, exp, log, sqrt, maximum, real, pi, quantile, newaxis
+from src.options.black_scholes.black_scholes import BlackScholes
+from src.options.heston_model.heston_model import HestonModel
+from src.risk.portfolio import MarketScenarios
+
+
+def risk_measures(pnl, confidence_levels=(0.95, 0.99)):
+    """
+    :param pnl: profit and loss of each scenario.
+    :param confidence_levels: levels of the VaR and ES, e.g. 0.99.
+    :return: dicts keyed by confidence level of the value at risk, the loss quantile, and the expected
+        shortfall, the mean loss beyond it. Both are positive for a loss.
+    """
+    losses = -asarray(pnl)
+    value_at_risk = {}
+    expected_shortfall = {}
+    for level in confidence_levels:
+        value_at_risk[level] = quantile(losses, level)
+        expected_shortfall[level] = losses[losses >= value_at_risk[level]].mean()
+    return value_at_risk, expected_shortfall
+
+
+class FullRevaluationVaR:
+
+    def __init__(self, portfolio, scenarios, block_size=None, n_nodes=128):
+        """
+        VaR and expected shortfall of a Portfolio by revaluing every position under every scenario.
+
+        The positions are grouped by underlying and maturity and the P&L is reported per group. Scenarios are
+        processed in blocks, each block being one vectorised evaluation:
+            - BlackScholes positions are priced with european_batch on a (scenarios, positions) grid.
+            - HestonModel positions sharing an underlying, maturity and parameters share C and D of the
+            characteristic function, which do not depend on the spot or v, and a rate shift only adds
+            i * phi * dr * t to C. The group's value is linear in the strike factors exp(-i * phi * ln(K)), so the
+            quantity weighted strike factors are summed once and each scenario costs one pass over the phi nodes
+            whatever the number of strikes.
+
+        :param portfolio: Portfolio of BlackScholes and HestonModel positions.
+        :param scenarios: MarketScenarios covering the underlyings of the portfolio.
+        :param block_size: number of scenarios revalued together, chosen to keep blocks around 10^6 prices if None.
+        :param n_nodes: number of Gauss-Legendre nodes of the Heston pricing, see probability_functions_gauss.
+        """
+        self.portfolio = portfolio
+        self.scenarios = scenarios
+        self.n_nodes = n_nodes
+
+        self.groups = []
+        group_of_position = []
+        for (underlying, option, option_type, quantity) in portfolio.positions:
+            key = (underlying, option.t)
+            if key not in self.groups:
+                self.groups.append(key)
+            group_of_position.append(self.groups.index(key))
+
+        black_scholes = [i for (i, position) in enumerate(portfolio.positions)
+                         if isinstance(position[1], BlackScholes)]
+        self.black_scholes_arrays(black_scholes, group_of_position)
+
+        heston = [i for (i, position) in enumerate(portfolio.positions) if isinstance(position[1], HestonModel)]
+        self.heston_groups = self.heston_strike_groups(heston, group_of_position)
+
+        n_black_scholes = max(len(black_scholes), 1)
+        self.block_size = max(2**20 // n_black_scholes, 1) if block_size is None else block_size
+
+    def black_scholes_arrays(self, positions, group_of_position):
+        options = [self.portfolio.positions[i][1] for i in positions]
+        self.bs_underlying = array([self.scenarios.index(self.portfolio.positions[i][0]) for i in positions],
+                                   dtype=int)
+        self.bs_option_type = array([self.portfolio.positions[i][2] for i in positions])
+        (self.bs_s, self.bs_k, self.bs_t, self.bs_sigma, self.bs_d, self.bs_r) = (
+            array([getattr(option, name) for option in options], dtype=float)
+            for name in ('s', 'k', 't', 'sigma', 'd', 'r'))
+        # Quantity of each position in its group, so position prices @ weights gives the group values.
+        self.bs_weights = zeros((len(positions), len(self.groups)))
+        for (row, i) in enumerate(positions):
+            self.bs_weights[row, group_of_position[i]] = self.portfolio.positions[i][3]
+
+    def heston_strike_groups(self, positions, group_of_position):
+        """
+        :return: one dict per set of Heston positions sharing the underlying, maturity and model parameters, with
+            the characteristic function terms at the base market and the quantity weighted strike factors.
+        """
+        strike_groups = {}
+        for i in positions:
+            (underlying, option, option_type, quantity) = self.portfolio.positions[i]
+            key = (underlying, option.s, option.t, option.v, option.r, option.theta, option.kappa, option.sigma,
+                   option.rho)
+            strike_groups.setdefault(key, []).append(i)
+
+        heston_groups = []
+        for (key, members) in strike_groups.items():
+            model = self.portfolio.positions[members[0]][1]
+            (phi, weights) = model.quadrature_rule(self.n_nodes)
+            k = array([self.portfolio.positions[i][1].k for i in members], dtype=float)
+            quantity = array([self.portfolio.positions[i][3] for i in members], dtype=float)
+            is_put = array([self.portfolio.positions[i][2] == 'put' for i in members])
+            strike_factor = exp(-phi * complex(0, 1) * log(k)[:, newaxis]) / (phi * complex(0, 1)) * weights
+
+            (c_1, d_1) = model.characteristic_function(phi, 1)[4:6]
+            (c_2, d_2) = model.characteristic_function(phi, 2)[4:6]
+            heston_groups.append({
+                'model': model,
+                'underlying': self.scenarios.index(key[0]),
+                'group': group_of_position[members[0]],
+                'phi': phi,
+                'c': (c_1, c_2),
+                'd': (d_1, d_2),
+                'weighted_strike_factor': (quantity @ strike_factor, (quantity * k) @ strike_factor),
+                'quantity': quantity.sum(),
+                'quantity_strike': quantity @ k,
+                'put_quantity': quantity[is_put].sum(),
+                'put_quantity_strike': quantity[is_put] @ k[is_put],
+            })
+        return heston_groups
+
+    def black_scholes_values(self, scenarios):
+        s = self.bs_s * exp(scenarios.spot_returns[:, self.bs_underlying])
+        sigma = maximum(self.bs_sigma + scenarios.vol_shifts[:, self.bs_underlying], 1e-8)
+        r = self.bs_r + scenarios.rate_shifts[:, newaxis]
+        prices = BlackScholes(s, self.bs_k, self.bs_t, sigma, self.bs_d, r).european_batch(self.bs_option_type)
+        return prices['price'] @ self.bs_weights
+
+    def heston_values(self, scenarios):
+        values = zeros((len(scenarios), len(self.groups)))
+        for group in self.heston_groups:
+            model = group['model']
+            phi = group['phi']
+            s = model.s * exp(scenarios.spot_returns[:, group['underlying']])
+            v = maximum(sqrt(model.v) + scenarios.vol_shifts[:, group['underlying']], 0)**2
+            dr = scenarios.rate_shifts
+            discount = exp(-(model.r + dr) * model.t)
+
+            # f_j = exp(C_j + D_j * v + i * phi * ln(s)) with the rate shift added to C_j, (scenarios, nodes).
+            shift = complex(0, 1) * phi * (dr * model.t + log(s))[:, newaxis]
+            f_1 = exp(group['c'][0] + group['d'][0] * v[:, newaxis] + shift)
+            f_2 = exp(group['c'][1] + group['d'][1] * v[:, newaxis] + shift)
+
+            # sum of quantity * call over the strikes, puts by put-call parity.
+            calls = s * (0.5 * group['quantity'] + real(f_1 @ group['weighted_strike_factor'][0]) / pi) - \
+                discount * (0.5 * group['quantity_strike'] + real(f_2 @ group['weighted_strike_factor'][1]) / pi)
+            values[:, group['group']] += calls - s * group['put_quantity'] + discount * group['put_quantity_strike']
+        return values
+
+    def group_values(self, scenarios):
+        """
+        :return: value of every group of the portfolio under the scenarios, of shape (scenarios, groups).
+        """
+        values = self.heston_values(scenarios)
+        if len(self.bs_s):
+            values += self.black_scholes_values(scenarios)
+        return values
+
+    def group_pnl(self):
+        """
+        :return: P&L of every group against the unshocked market, of shape (scenarios, groups).
+        """
+        unshocked = MarketScenarios(self.scenarios.underlyings, zeros((1, len(self.scenarios.underlyings))))
+        base = self.group_values(unshocked)
+        pnl = empty((len(self.scenarios), len(self.groups)))
+        for start in range(0, len(self.scenarios), self.block_size):
+            stop = min(start + self.block_size, len(self.scenarios))
+            pnl[start:stop] = self.group_values(self.scenarios.block(start, stop)) - base
+        return pnl
+
+    def run(self, confidence_levels=(0.95, 0.99)):
+        """
+        :return: dict of the portfolio pnl per scenario, the group_pnl of shape (scenarios, groups) with the
+            (underlying, maturity) groups, and the value_at_risk and expected_shortfall keyed by confidence level.
+        """
+        group_pnl = self.group_pnl()
+        pnl = group_pnl.sum(axis=1)
+        (value_at_risk, expected_shortfall) = risk_measures(pnl, confidence_levels)
+        return {'pnl': pnl,
+                'group_pnl': group_pnl,
+                'groups': self.groups,
+                'value_at_risk': value_at_risk,
+                'expected_shortfall': expected_shortfall}